@@ -0,0 +1,4 @@
+from .auth import Auth0, get_token_auth_header, permission_set
+from .errors import AuthError
+from .jwks import JWKSCache, JWKSRefresher
+from .tokens import VerifiedTokenCache
@@ -0,0 +1,185 @@
+from functools import wraps
+
+from flask import request
+from jose import jwt
+
+from .errors import AuthError
+from .jwks import JWKSCache, JWKSRefresher
+from .tokens import VerifiedTokenCache
+
+
+def get_token_auth_header():
+    """Obtains the Access Token from the Authorization Header
+    """
+    auth = request.headers.get('Authorization', None)
+    if not auth:
+        raise AuthError({
+            'code': 'authorization_header_missing',
+            'description': 'Authorization header is expected.'
+        }, 401)
+
+    parts = auth.split()
+    if not parts:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    elif parts[0].lower() != 'bearer':
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must start with "Bearer".'
+        }, 401)
+
+    elif len(parts) == 1:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Token not found.'
+        }, 401)
+
+    elif len(parts) > 2:
+        raise AuthError({
+            'code': 'invalid_header',
+            'description': 'Authorization header must be bearer token.'
+        }, 401)
+
+    return parts[1]
+
+
+def permission_set(permission):
+    """Compiles the permission(s) required by an endpoint into a frozenset
+    """
+    if not permission:
+        return frozenset()
+    if isinstance(permission, str):
+        return frozenset((permission,))
+    return frozenset(permission)
+
+
+class Auth0:
+    '''
+    Auth0(domain, audience)
+        verifies the bearer tokens issued by an Auth0 tenant for one api
+        the signing keys are cached by kid (JWKSCache) and verified tokens are
+        cached until they expire (VerifiedTokenCache)
+        permission_error_status is the status code used when the token
+        does not carry the permissions required by the endpoint
+    '''
+
+    def __init__(self, domain, audience, algorithms=('RS256',), jwks_url=None, jwks_ttl=600,
+                 token_cache_size=1024, permission_error_status=403):
+        self.domain = domain
+        self.audience = audience
+        self.algorithms = list(algorithms)
+        self.issuer = f'https://{domain}/'
+        self.permission_error_status = permission_error_status
+        self.jwks = JWKSCache(jwks_url or f'https://{domain}/.well-known/jwks.json', ttl=jwks_ttl,
+                              algorithm=self.algorithms[0])
+        self.verified_tokens = VerifiedTokenCache(token_cache_size)
+        self.refresher = None
+
+    def init_app(self, app):
+        """Registers the verifier on the app and, unless JWKS_BACKGROUND_REFRESH is False,
+        starts the thread renewing the signing keys in the background
+        """
+        app.extensions['fsnd_auth'] = self
+        if app.config.get('JWKS_BACKGROUND_REFRESH', True):
+            self.start_refresher(app.config.get('JWKS_REFRESH_MARGIN', 60))
+
+    def start_refresher(self, margin=60):
+        if self.refresher is None or not self.refresher.is_alive():
+            self.refresher = JWKSRefresher(self.jwks, margin)
+            self.refresher.start()
+        return self.refresher
+
+    def stop_refresher(self):
+        if self.refresher is not None:
+            self.refresher.stop()
+            self.refresher = None
+
+    def verify_decode_jwt(self, token):
+        try:
+            unverified_header = jwt.get_unverified_header(token)
+        except jwt.JWTError:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to parse authentication token.'
+            }, 401)
+        if 'kid' not in unverified_header:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Authorization malformed.'
+            }, 401)
+
+        key = self.jwks.get(unverified_header['kid'])
+        if key is None:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to find the appropriate key.'
+            }, 400)
+        try:
+            return jwt.decode(
+                token,
+                key,
+                algorithms=self.algorithms,
+                audience=self.audience,
+                issuer=self.issuer
+            )
+
+        except jwt.ExpiredSignatureError:
+            raise AuthError({
+                'code': 'token_expired',
+                'description': 'Token expired.'
+            }, 401)
+
+        except jwt.JWTClaimsError:
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Incorrect claims. Please, check the audience and issuer.'
+            }, 401)
+        except Exception:
+            raise AuthError({
+                'code': 'invalid_header',
+                'description': 'Unable to parse authentication token.'
+            }, 400)
+
+    def verify(self, token):
+        """Returns the payload of the token and its permissions as a frozenset
+        (None when the token has no permissions claim)
+        """
+        entry = self.verified_tokens.get(token)
+        if entry is not None:
+            return entry
+        payload = self.verify_decode_jwt(token)
+        permissions = payload.get('permissions')
+        permissions = frozenset(permissions) if permissions is not None else None
+        self.verified_tokens.set(token, payload, permissions)
+        return payload, permissions
+
+    def check_permissions(self, required, permissions):
+        if permissions is None:
+            raise AuthError({
+                'code': 'invalid_claims',
+                'description': 'Permissions not included in the token.'
+            }, self.permission_error_status)
+        if not required <= permissions:
+            raise AuthError({
+                'code': 'unauthorized',
+                'description': 'Permission not found.'
+            }, self.permission_error_status)
+        return True
+
+    def requires_auth(self, permission=''):
+        required = permission_set(permission)
+
+        def requires_auth_decorator(f):
+            @wraps(f)
+            def wrapper(*args, **kwargs):
+                token = get_token_auth_header()
+                payload, permissions = self.verify(token)
+                self.check_permissions(required, permissions)
+                return f(payload, *args, **kwargs)
+
+            return wrapper
+
+        return requires_auth_decorator
@@ -0,0 +1,147 @@
+import json
+import threading
+import time
+from urllib.request import urlopen
+
+from jose import jwk
+
+from .errors import AuthError
+
+
+class JWKSCache:
+    '''
+    JWKSCache(url, ttl)
+        process wide cache of the json web keys keyed by kid
+        every key is parsed once into a jose key object when it is fetched
+        so verifying a token does not rebuild the key
+        the keys are fetched again when the ttl expires or when a token
+        comes with an unknown kid (at most once every miss_interval seconds)
+        only one thread fetches at a time, the others reuse its result
+        if a fetch fails the old keys are still served until the next retry
+        when a JWKSRefresher runs in the background, an expired cache keeps
+        serving its keys and only the refresher fetches them again
+    '''
+
+    def __init__(self, url, ttl=600, algorithm='RS256', miss_interval=30, retry_interval=10, timeout=5):
+        self.url = url
+        self.ttl = ttl
+        self.algorithm = algorithm
+        self.miss_interval = miss_interval
+        self.retry_interval = retry_interval
+        self.timeout = timeout
+        self._keys = {}
+        self._fetched_at = None
+        self._expires_at = 0
+        self._generation = 0
+        self._lock = threading.Lock()
+        self.background = False
+        self.last_refresh = None
+        self.last_error = None
+        self.failures = 0
+        self.consecutive_failures = 0
+
+    def fetch(self):
+        with urlopen(self.url, timeout=self.timeout) as response:
+            json_web_keys = json.loads(response.read())
+        return self.parse(json_web_keys)
+
+    def parse(self, json_web_keys):
+        keys = {}
+        for key in json_web_keys['keys']:
+            if 'kid' not in key or key.get('use', 'sig') != 'sig':
+                continue
+            keys[key['kid']] = jwk.construct(key, self.algorithm)
+        return keys
+
+    def refresh(self, generation=None):
+        with self._lock:
+            # another thread already refreshed while we were waiting for the lock
+            if generation is not None and generation != self._generation:
+                return
+            now = time.monotonic()
+            try:
+                keys = self.fetch()
+            except Exception as error:
+                self.failures += 1
+                self.consecutive_failures += 1
+                self.last_error = repr(error)
+                self._generation += 1
+                self._expires_at = now + self.retry_interval
+                if not self._keys:
+                    raise AuthError({
+                        'code': 'jwks_unavailable',
+                        'description': 'Unable to fetch the signing keys.'
+                    }, 503)
+                return
+            self._keys = keys
+            self._fetched_at = now
+            self._expires_at = now + self.ttl
+            self._generation += 1
+            self.last_refresh = time.time()
+            self.consecutive_failures = 0
+
+    def get(self, kid):
+        generation = self._generation
+        now = time.monotonic()
+        if not self._keys or (now >= self._expires_at and not self.background):
+            self.refresh(generation)
+        elif kid not in self._keys and (self._fetched_at is None or now - self._fetched_at >= self.miss_interval):
+            self.refresh(generation)
+        return self._keys.get(kid)
+
+    def expires_in(self):
+        return self._expires_at - time.monotonic()
+
+    def status(self):
+        return {
+            'keys': len(self._keys),
+            'last_refresh': self.last_refresh,
+            'expires_in': self.expires_in(),
+            'failures': self.failures,
+            'consecutive_failures': self.consecutive_failures,
+            'last_error': self.last_error
+        }
+
+    def clear(self):
+        with self._lock:
+            self._keys = {}
+            self._fetched_at = None
+            self._expires_at = 0
+            self._generation += 1
+
+
+class JWKSRefresher(threading.Thread):
+    '''
+    JWKSRefresher(cache, margin)
+        daemon thread renewing the keys of a JWKSCache margin seconds before they expire
+        so a request never waits for Auth0 because the ttl ran out
+        after a failed fetch it retries every retry_interval seconds of the cache
+        (the failures are counted in the cache status)
+    '''
+
+    def __init__(self, cache, margin=60):
+        super().__init__(name='jwks-refresher', daemon=True)
+        self.cache = cache
+        self.margin = margin
+        self._stopped = threading.Event()
+
+    def next_delay(self):
+        return max(self.cache.expires_in() - self.margin, self.cache.retry_interval)
+
+    def run(self):
+        while not self._stopped.is_set():
+            try:
+                self.cache.refresh()
+            except AuthError:
+                pass
+            self._stopped.wait(self.next_delay())
+
+    def start(self):
+        self.cache.background = True
+        super().start()
+
+    def stop(self, timeout=None):
+        self._stopped.set()
+        self.cache.background = False
+        if self.is_alive():
+            self.join(timeout)
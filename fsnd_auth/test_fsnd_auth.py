@@ -0,0 +1,265 @@
+import json
+import os
+import tempfile
+import threading
+import time
+import unittest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from flask import Flask, jsonify
+from jose import jwk, jwt
+
+from fsnd_auth import Auth0, AuthError, JWKSCache, JWKSRefresher
+
+DOMAIN = 'fsnd.test.auth0.com'
+AUDIENCE = 'test'
+
+
+def make_key(kid):
+    """Generates an RSA key pair, returns the private key (PEM) and the public JWK"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    public_key = jwk.construct(private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo), 'RS256').to_dict()
+    public_key = {name: value.decode() if isinstance(value, bytes) else value for name, value in public_key.items()}
+    public_key.update(kid=kid, use='sig')
+    return pem, public_key
+
+
+class AuthTestCase(unittest.TestCase):
+    """This class represents the shared auth package test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.public_key = make_key('key-1')
+        cls.other_pem, cls.other_public_key = make_key('key-2')
+
+    def setUp(self):
+        """Write the signing keys to a local JWKS file and build an app using it"""
+        handle, self.jwks_path = tempfile.mkstemp(suffix='.json')
+        os.close(handle)
+        self.write_jwks(self.public_key)
+        self.auth0 = Auth0(DOMAIN, AUDIENCE, jwks_url='file://' + self.jwks_path, permission_error_status=403)
+        self.fetches = 0
+        fetch = self.auth0.jwks.fetch
+
+        def counted_fetch():
+            self.fetches += 1
+            time.sleep(0.01)
+            return fetch()
+
+        self.auth0.jwks.fetch = counted_fetch
+
+        self.app = Flask(__name__)
+
+        @self.app.route('/secret')
+        @self.auth0.requires_auth('get:secret')
+        def secret(payload):
+            return jsonify({'sub': payload['sub']})
+
+        @self.app.errorhandler(AuthError)
+        def auth_error(error):
+            return jsonify({'error': error.status_code, 'message': error.error}), error.status_code
+
+        self.client = self.app.test_client
+
+    def tearDown(self):
+        os.remove(self.jwks_path)
+
+    def write_jwks(self, *keys):
+        with open(self.jwks_path, 'w') as jwks_file:
+            json.dump({'keys': list(keys)}, jwks_file)
+
+    def token(self, permissions=('get:secret',), kid='key-1', pem=None, expires_in=3600):
+        claims = {
+            'iss': f'https://{DOMAIN}/',
+            'aud': AUDIENCE,
+            'sub': 'user',
+            'exp': int(time.time()) + expires_in,
+            'permissions': list(permissions)
+        }
+        return jwt.encode(claims, pem or self.pem, algorithm='RS256', headers={'kid': kid})
+
+    def get_secret(self, token):
+        return self.client().get('/secret', headers={'Authorization': 'Bearer ' + token})
+
+    def test_access_granted(self):
+        """A valid token with the required permission reaches the endpoint"""
+        res = self.get_secret(self.token())
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['sub'], 'user')
+
+    def test_missing_permission(self):
+        """A valid token without the required permission is rejected with permission_error_status"""
+        res = self.get_secret(self.token(permissions=('get:other',)))
+        self.assertEqual(res.status_code, 403)
+        self.assertEqual(res.json['message']['code'], 'unauthorized')
+
+    def test_missing_header(self):
+        res = self.client().get('/secret')
+        self.assertEqual(res.status_code, 401)
+
+    def test_blank_header(self):
+        """A header holding only whitespace is an invalid header, not a server error"""
+        for header in (' ', '\t', 'Bearer', 'Basic abc', 'Bearer a b'):
+            res = self.client().get('/secret', headers={'Authorization': header})
+            self.assertEqual(res.status_code, 401, header)
+            self.assertEqual(res.json['message']['code'], 'invalid_header')
+
+    def test_expired_token(self):
+        res = self.get_secret(self.token(expires_in=-10))
+        self.assertEqual(res.status_code, 401)
+        self.assertEqual(res.json['message']['code'], 'token_expired')
+
+    def test_keys_are_parsed_once(self):
+        """The JWKS is fetched once and reused for every request"""
+        for _ in range(5):
+            self.assertEqual(self.get_secret(self.token()).status_code, 200)
+        self.assertEqual(self.fetches, 1)
+
+    def test_verified_token_cache(self):
+        """Repeated requests with the same token skip the verification"""
+        token = self.token()
+        for _ in range(3):
+            self.assertEqual(self.get_secret(token).status_code, 200)
+        self.assertEqual(self.auth0.verified_tokens.misses, 1)
+        self.assertEqual(self.auth0.verified_tokens.hits, 2)
+
+    def test_unknown_kid_refreshes_once(self):
+        """Concurrent requests with a new kid cause a single fetch"""
+        self.auth0.verify(self.token())
+        self.assertEqual(self.fetches, 1)
+        self.write_jwks(self.public_key, self.other_public_key)
+        self.auth0.jwks.miss_interval = 0
+        token = self.token(kid='key-2', pem=self.other_pem)
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(self.auth0.verify_decode_jwt(token)))
+                   for _ in range(10)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(len(results), 10)
+        self.assertEqual(self.fetches, 2)
+
+    def test_stale_keys_served_when_fetch_fails(self):
+        self.auth0.verify(self.token())
+        os.remove(self.jwks_path)
+        open(self.jwks_path, 'w').close()
+        self.auth0.jwks._expires_at = 0
+        self.auth0.verified_tokens.clear()
+        payload, permissions = self.auth0.verify(self.token())
+        self.assertEqual(payload['sub'], 'user')
+        self.assertEqual(permissions, frozenset(['get:secret']))
+        self.assertEqual(self.fetches, 2)
+
+    def test_no_keys_available(self):
+        self.auth0.jwks.url = 'file:///nonexistent/jwks.json'
+        res = self.get_secret(self.token())
+        self.assertEqual(res.status_code, 503)
+
+
+class FakeAuth0(ThreadingHTTPServer):
+    """Local HTTP stand-in for the Auth0 /.well-known/jwks.json endpoint"""
+
+    def __init__(self):
+        self.keys = []
+        self.available = True
+        self.requests = 0
+        super().__init__(('127.0.0.1', 0), FakeAuth0Handler)
+        self.url = 'http://127.0.0.1:{}/.well-known/jwks.json'.format(self.server_address[1])
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+
+class FakeAuth0Handler(BaseHTTPRequestHandler):
+    def do_GET(self):
+        self.server.requests += 1
+        if not self.server.available:
+            self.send_error(503)
+            return
+        body = json.dumps({'keys': self.server.keys}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class RefresherTestCase(unittest.TestCase):
+    """This class represents the background JWKS refresher test case"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls.pem, cls.public_key = make_key('key-1')
+
+    def setUp(self):
+        self.server = FakeAuth0()
+        self.server.keys = [self.public_key]
+        self.cache = JWKSCache(self.server.url, ttl=0.2, retry_interval=0.05)
+        self.refresher = JWKSRefresher(self.cache, margin=0.1)
+
+    def tearDown(self):
+        self.refresher.stop(timeout=1)
+        self.server.stop()
+
+    def wait_for(self, condition, timeout=2):
+        deadline = time.monotonic() + timeout
+        while not condition() and time.monotonic() < deadline:
+            time.sleep(0.01)
+        self.assertTrue(condition())
+
+    def test_refresh_before_expiry(self):
+        """The keys are renewed in the background and never expire for the readers"""
+        self.refresher.start()
+        self.wait_for(lambda: self.server.requests >= 3)
+        self.assertIsNotNone(self.cache.get('key-1'))
+        self.assertGreater(self.cache.expires_in(), 0)
+        self.assertIsNotNone(self.cache.status()['last_refresh'])
+        self.assertEqual(self.cache.status()['failures'], 0)
+
+    def test_failures_are_counted_and_keys_kept(self):
+        """When Auth0 is down the refresher counts the failures and the old keys are served"""
+        self.refresher.start()
+        self.wait_for(lambda: self.cache.last_refresh is not None)
+        self.server.available = False
+        self.wait_for(lambda: self.cache.consecutive_failures >= 2)
+        requests = self.server.requests
+        self.assertIsNotNone(self.cache.get('key-1'))
+        self.assertEqual(self.server.requests, requests)
+        self.server.available = True
+        self.wait_for(lambda: self.cache.consecutive_failures == 0)
+        self.assertGreaterEqual(self.cache.status()['failures'], 2)
+
+    def test_init_app_starts_refresher(self):
+        auth0 = Auth0(DOMAIN, AUDIENCE, jwks_url=self.server.url)
+        app = Flask(__name__)
+        auth0.init_app(app)
+        try:
+            self.assertIs(app.extensions['fsnd_auth'], auth0)
+            self.wait_for(lambda: auth0.jwks.last_refresh is not None)
+            self.assertTrue(auth0.jwks.background)
+        finally:
+            auth0.stop_refresher()
+
+    def test_init_app_without_refresher(self):
+        auth0 = Auth0(DOMAIN, AUDIENCE, jwks_url=self.server.url)
+        app = Flask(__name__)
+        app.config['JWKS_BACKGROUND_REFRESH'] = False
+        auth0.init_app(app)
+        self.assertIsNone(auth0.refresher)
+        self.assertEqual(self.server.requests, 0)
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,56 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class VerifiedTokenCache:
+    '''
+    VerifiedTokenCache(maxsize)
+        bounded lru cache of already verified tokens keyed by the sha256 digest of the token
+        an entry keeps the payload and its permissions as a frozenset, and is dropped
+        once the token expires so expired tokens are verified (and rejected) again
+        hits and misses are counted to check how well the cache is doing
+    '''
+
+    def __init__(self, maxsize=1024):
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def digest(token):
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token):
+        digest = self.digest(token)
+        with self._lock:
+            entry = self._entries.get(digest)
+            if entry is not None:
+                payload, permissions, expires_at = entry
+                if time.time() < expires_at:
+                    self._entries.move_to_end(digest)
+                    self.hits += 1
+                    return payload, permissions
+                del self._entries[digest]
+            self.misses += 1
+        return None
+
+    def set(self, token, payload, permissions):
+        expires_at = payload.get('exp')
+        if not isinstance(expires_at, (int, float)):
+            return
+        digest = self.digest(token)
+        with self._lock:
+            self._entries[digest] = (payload, permissions, expires_at)
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
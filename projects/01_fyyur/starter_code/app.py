@@ -4,17 +4,22 @@
 
 import logging
 import os
+from itertools import groupby
 from logging import Formatter, FileHandler
 
 import babel
 import dateutil.parser
-from flask import Flask, render_template, request, flash, redirect, url_for, json
+from flask import Flask, render_template, request, flash, redirect, url_for, abort
 from flask_migrate import Migrate
 from flask_moment import Moment
 from flask_sqlalchemy import SQLAlchemy
-from sqlalchemy import func, or_
+from markupsafe import Markup
+from sqlalchemy import DDL, case, event, func, literal_column, or_, select, union
+from sqlalchemy.orm import selectinload
 
+from area_cache import area_cache
 from forms import *
+from search_index import artist_search_index, tokenize, venue_search_index
 
 # ----------------------------------------------------------------------------#
 # App Config.
@@ -31,6 +36,30 @@ migrate = Migrate(app, db)
 # Models.
 # ----------------------------------------------------------------------------#
 
+# the relationships are never loaded implicitly (lazy="raise"), every query says what it
+# needs as column projections (the shows of a page are read a page at a time, see Queries)
+
+class Genre(db.Model):
+    __tablename__ = 'genres'
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(120), nullable=False, unique=True)
+
+
+# the genres of the venues and the artists, the (genre_id, entity id) indexes list the
+# venues or the artists of a genre in id order
+venue_genres = db.Table(
+    'venue_genres',
+    db.Column('venue_id', db.Integer, db.ForeignKey('Venue.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_venue_genres_genre_id_venue_id', 'genre_id', 'venue_id'))
+
+artist_genres = db.Table(
+    'artist_genres',
+    db.Column('artist_id', db.Integer, db.ForeignKey('Artist.id', ondelete='CASCADE'), primary_key=True),
+    db.Column('genre_id', db.Integer, db.ForeignKey('genres.id', ondelete='CASCADE'), primary_key=True),
+    db.Index('ix_artist_genres_genre_id_artist_id', 'genre_id', 'artist_id'))
+
+
 class Venue(db.Model):
     __tablename__ = 'Venue'
     id = db.Column(db.Integer, primary_key=True)
@@ -40,9 +69,9 @@ class Venue(db.Model):
     address = db.Column(db.String(120))
     phone = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
-    genres = db.Column(db.String(120))
     facebook_link = db.Column(db.String(120))
-    artists = db.relationship('Show', back_populates="venue", lazy="joined")
+    genres = db.relationship('Genre', secondary=venue_genres, order_by=Genre.name, lazy="raise")
+    artists = db.relationship('Show', back_populates="venue", lazy="raise")
 
 
 class Artist(db.Model):
@@ -52,20 +81,38 @@ class Artist(db.Model):
     city = db.Column(db.String(120))
     state = db.Column(db.String(120))
     phone = db.Column(db.String(120))
-    genres = db.Column(db.String(120))
     image_link = db.Column(db.String(500))
     facebook_link = db.Column(db.String(120))
-    venues = db.relationship('Show', back_populates="artist", lazy="joined")
+    genres = db.relationship('Genre', secondary=artist_genres, order_by=Genre.name, lazy="raise")
+    venues = db.relationship('Show', back_populates="artist", lazy="raise")
 
 
 class Show(db.Model):
     __tablename__ = 'shows'
+    # the venue and artist pages read the shows of one venue/artist before or after now
+    __table_args__ = (db.Index('ix_shows_venue_id_create_at', 'Venue_id', 'create_at'),
+                      db.Index('ix_shows_artist_id_create_at', 'Artist_id', 'create_at'))
     id = db.Column(db.Integer, primary_key=True)
     Venue_id = db.Column('Venue_id', db.ForeignKey('Venue.id'), primary_key=True)
     Artist_id = db.Column('Artist_id', db.ForeignKey('Artist.id'), primary_key=True)
     create_at = db.Column('create_at', db.DateTime)
-    venue = db.relationship("Venue", back_populates='artists', lazy="joined")
-    artist = db.relationship("Artist", back_populates='venues', lazy="joined")
+    venue = db.relationship("Venue", back_populates='artists', lazy="raise")
+    artist = db.relationship("Artist", back_populates='venues', lazy="raise")
+
+
+def search_document(model):
+    # to_tsvector('simple', name || ' ' || city || ' ' || state) of a venue or an artist,
+    # the expression of its GIN index (the search must use the very same one)
+    document = None
+    for column in (model.name, model.city, model.state):
+        part = func.coalesce(column, literal_column("''"))
+        document = part if document is None else document.op('||')(literal_column("' '")).op('||')(part)
+    return func.to_tsvector(literal_column("'simple'"), document)
+
+
+for searchable in (Venue, Artist):
+    event.listen(searchable.__table__, 'after_create', DDL('CREATE INDEX "ix_{0}_search" ON "{0}" USING gin ({1})'.format(
+        searchable.__tablename__, search_document(searchable).compile())).execute_if(dialect='postgresql'))
 
 
 # ----------------------------------------------------------------------------#
@@ -84,6 +131,173 @@ def format_datetime(value, formatting='medium'):
 app.jinja_env.filters['datetime'] = format_datetime
 
 
+# ----------------------------------------------------------------------------#
+# Queries.
+# ----------------------------------------------------------------------------#
+
+def count_shows(show_column, entity_id, now):
+    # (upcoming, past) number of shows of a venue or an artist, counted by the database
+    return db.session.query(func.count().filter(Show.create_at >= now),
+                            func.count().filter(Show.create_at < now)) \
+        .filter(show_column == entity_id).one()
+
+
+def page_of_shows(show_column, entity_id, other, now, upcoming, page):
+    # one page of the upcoming (soonest first) or past (latest first) shows of a venue
+    # or an artist with the other side of each show, read from the (id, create_at) index
+    per_page = app.config['SHOWS_PER_PAGE']
+    other_column = Show.Artist_id if other is Artist else Show.Venue_id
+    query = db.session.query(other.id, other.name, other.image_link, Show.create_at) \
+        .join(other, other_column == other.id).filter(show_column == entity_id)
+    if upcoming:
+        query = query.filter(Show.create_at >= now).order_by(Show.create_at)
+    else:
+        query = query.filter(Show.create_at < now).order_by(Show.create_at.desc())
+    return query.offset((page - 1) * per_page).limit(per_page).all()
+
+
+def load_areas():
+    # every venue grouped by city and state with its number of upcoming shows, in one query
+    # (the upcoming shows are counted per venue before the join)
+    upcoming = db.session.query(Show.Venue_id, func.count().label('num_upcoming_shows')) \
+        .filter(Show.create_at >= datetime.now()).group_by(Show.Venue_id).subquery()
+    rows = db.session.query(Venue.city, Venue.state, Venue.id, Venue.name,
+                            func.coalesce(upcoming.c.num_upcoming_shows, 0)) \
+        .outerjoin(upcoming, upcoming.c.Venue_id == Venue.id) \
+        .order_by(Venue.city, Venue.state, Venue.id).all()
+    return [{
+        'city': city,
+        'state': state,
+        'venues': [{'id': venue_id, 'name': name, 'num_upcoming_shows': num_upcoming_shows}
+                   for _, _, venue_id, name, num_upcoming_shows in venues]
+    } for (city, state), venues in groupby(rows, key=lambda row: (row[0], row[1]))]
+
+
+def genres_named(names):
+    # the Genre rows of the names (of the genres form field), the new ones are added to the session
+    names = sorted(set(name for name in names if name))
+    genres = db.session.query(Genre).filter(Genre.name.in_(names)).all() if names else []
+    known = set(genre.name for genre in genres)
+    genres += [Genre(name=name) for name in names if name not in known]
+    return genres
+
+
+def page_of_genre(model, association, genre_name, after_id):
+    # (genre, [(id, name)], next after_id) the venues or artists of a genre after after_id in id
+    # order, read from the (genre_id, entity id) index of the association table (postgres does
+    # not carry the after_id bound through the join, both sides get it)
+    genre = db.session.query(Genre.id, Genre.name).filter(Genre.name == genre_name).one_or_none()
+    if genre is None:
+        abort(404)
+    per_page = app.config['GENRE_PAGE_SIZE']
+    entity_id = association.c.venue_id if model is Venue else association.c.artist_id
+    rows = db.session.query(model.id, model.name).join(association, entity_id == model.id) \
+        .filter(association.c.genre_id == genre.id, entity_id > after_id, model.id > after_id) \
+        .order_by(entity_id).limit(per_page + 1).all()
+    next_after_id = rows[per_page - 1][0] if len(rows) > per_page else None
+    return genre, rows[:per_page], next_after_id
+
+
+def genre_association(model):
+    # the association table of the genres of a venue or an artist and its entity id column
+    if model is Venue:
+        return venue_genres, venue_genres.c.venue_id
+    return artist_genres, artist_genres.c.artist_id
+
+
+def search_rows(model):
+    # (id, name, city, state, genre names) of every venue or artist, the documents of a search_index
+    association, entity_id = genre_association(model)
+    genres = {}
+    for genre_entity_id, genre_name in db.session.query(entity_id, Genre.name) \
+            .join(Genre, Genre.id == association.c.genre_id):
+        genres.setdefault(genre_entity_id, []).append(genre_name)
+    return [(row_id, name, city, state, ' '.join(genres.get(row_id, ())))
+            for row_id, name, city, state in db.session.query(model.id, model.name, model.city, model.state)]
+
+
+def genre_words(words):
+    # {position of a word of the term: ids of the genres having it in their name}, the last
+    # word as a prefix, the genres are few so they are all read and tokenized as search_index does
+    matches = {}
+    genres = [(genre_id, tokenize(name)) for genre_id, name in db.session.query(Genre.id, Genre.name)]
+    for position, word in enumerate(words):
+        prefix = position == len(words) - 1
+        genre_ids = [genre_id for genre_id, tokens in genres
+                     if any(token == word or (prefix and token.startswith(word)) for token in tokens)]
+        if genre_ids:
+            matches[position] = genre_ids
+    return matches
+
+
+def search_entities(model, search_index, term, page):
+    # (total, [(id, name)]) page of the venues or artists having every word of the term in their
+    # name, city, state or genres (the last word as a prefix, it is still being typed), ranked as
+    # search_index.rank_key among the first SEARCH_MAX_RESULTS matches (total is at most that)
+    per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+    max_results = app.config['SEARCH_MAX_RESULTS']
+    # the words past SEARCH_MAX_WORDS are ignored, every word adds a predicate
+    words = tokenize(term)[:app.config['SEARCH_MAX_WORDS']]
+    if not words:
+        return 0, []
+    if db.engine.dialect.name != 'postgresql':
+        if not search_index.built:
+            search_index.build(search_rows(model))
+        return search_index.search(' '.join(words), (page - 1) * per_page, per_page, max_results)
+    # every word is a quoted lexeme, the term can not inject tsquery operators
+    lexemes = ["'{}'".format(word) for word in words[:-1]] + ["'{}':*".format(words[-1])]
+    document = search_document(model)
+    genres = genre_words(words)
+    association, association_id = genre_association(model)
+    # the words of no genre name are matched together by one scan of the GIN index, a word of a
+    # genre name is either in the document or one of the genres: one predicate per word, written
+    # as the union of the ids of both (an OR of the two makes postgres evaluate the document of
+    # every row, the union reads the GIN index and the association index)
+    query = db.session.query(model.id, model.name)
+    document_lexemes = [lexeme for position, lexeme in enumerate(lexemes) if position not in genres]
+    if document_lexemes:
+        query = query.filter(document.op('@@')(func.to_tsquery('simple', ' & '.join(document_lexemes))))
+    for position, genre_ids in sorted(genres.items()):
+        in_document = select([model.id]).where(document.op('@@')(func.to_tsquery('simple', lexemes[position])))
+        with_genre = select([association_id]).where(association.c.genre_id.in_(genre_ids))
+        query = query.filter(model.id.in_(union(in_document, with_genre)))
+    candidates = query.limit(max_results).subquery()
+    # the words are letters and digits only, \m matches at the start of a word
+    name = func.lower(candidates.c.name)
+    in_name = sum(case([(name.op('~')(r'\m' + word), 1)], else_=0) for word in words)
+    starts_with = name.op('~')('^[^[:alnum:]]*' + words[0])
+    # the matches are counted by the same statement, the index is read once
+    results = db.session.query(candidates.c.id, candidates.c.name, func.count().over()) \
+        .order_by(in_name.desc(), starts_with.desc(), func.length(func.coalesce(candidates.c.name, '')),
+                  candidates.c.id) \
+        .offset((page - 1) * per_page).limit(per_page).all()
+    if results:
+        return results[0][2], [(entity_id, entity_name) for entity_id, entity_name, _ in results]
+    # a page past the last one
+    return db.session.query(func.count()).select_from(candidates).scalar(), []
+
+
+def search_page(model, search_index):
+    # the search_term and page of the search form (POST) or of the pages links (GET)
+    search_term = request.values.get('search_term', '')
+    page = max(request.values.get('page', 1, type=int), 1)
+    total, results = search_entities(model, search_index, search_term, page)
+    per_page = app.config['SEARCH_RESULTS_PER_PAGE']
+    return {
+        "count": total,
+        "more": total == app.config['SEARCH_MAX_RESULTS'],
+        "data": [{"id": entity_id, "name": name} for entity_id, name in results],
+        "page": page,
+        "has_next": page * per_page < total
+    }, search_term
+
+
+def requested_show_pages():
+    # the upcoming_page and past_page query parameters, 1 when missing or invalid
+    return (max(request.args.get('upcoming_page', 1, type=int), 1),
+            max(request.args.get('past_page', 1, type=int), 1))
+
+
 # ----------------------------------------------------------------------------#
 # Controllers.
 # ----------------------------------------------------------------------------#
@@ -98,36 +312,30 @@ def index():
 
 @app.route('/venues')
 def venues():
-    test = db.session.query(Venue.city, Venue.state, func.array_agg(Venue.id), func.array_agg(Venue.name)).group_by(
-        Venue.city, Venue.state).all()
-    data = []
-    for c in test:
-        group = {'city': c[0], 'state': c[1], 'venues': []}
-        for b1, b2 in zip(c[2], c[3]):
-            group['venues'].append({'id': b1, 'name': b2})
-        data.append(group)
-    return render_template('pages/venues.html', areas=data)
+    # the directory is rendered once per cache entry, the page around it (flashed messages) per request
+    directory = area_cache.get(lambda: Markup(render_template('pages/venue_areas.html', areas=load_areas())))
+    return render_template('pages/venues.html', directory=directory)
 
 
-@app.route('/venues/search', methods=['POST'])
+@app.route('/venues/search', methods=['GET', 'POST'])
 def search_venues():
-    result = db.session.query(Venue).filter(Venue.name.ilike('%{0}%'.format(request.form.get('search_term', '')))).all()
-    data = []
-    for col in result:
-        data.append({"id": col.id, "name": col.name})
-    response = {"count": len(result), "data": data}
-    return render_template('pages/search_venues.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    response, search_term = search_page(Venue, venue_search_index)
+    return render_template('pages/search_venues.html', results=response, search_term=search_term)
 
 
 @app.route('/venues/<int:venue_id>')
 def show_venue(venue_id):
     # shows the venue page with the given venue_id
-    venue = db.session.query(Venue).get(venue_id)
+    venue = db.session.query(Venue).options(selectinload(Venue.genres)).get(venue_id)
+    if venue is None:
+        abort(404)
+    now = datetime.now()
+    upcoming_page, past_page = requested_show_pages()
+    upcoming_count, past_count = count_shows(Show.Venue_id, venue_id, now)
     data = {
         "id": venue.id,
         "name": venue.name,
-        "genres": json.loads(venue.genres),
+        "genres": [genre.name for genre in venue.genres],
         "address": venue.address,
         "city": venue.city,
         "state": venue.state,
@@ -138,26 +346,21 @@ def show_venue(venue_id):
         "image_link": venue.image_link,
         "past_shows": [],
         "upcoming_shows": [],
-        "past_shows_count": 0,
-        "upcoming_shows_count": 0,
+        "past_shows_count": past_count,
+        "upcoming_shows_count": upcoming_count,
+        "past_page": past_page,
+        "upcoming_page": upcoming_page,
+        "shows_per_page": app.config['SHOWS_PER_PAGE'],
     }
-    for artist in venue.artists:
-        if artist.create_at < datetime.now():
-            data["past_shows"].append({
-                "artist_id": artist.artist.id,
-                "artist_name": artist.artist.name,
-                "artist_image_link": artist.artist.image_link,
-                "start_time": artist.create_at.strftime("%d/%m/%Y %H:%M:%S")
-            })
-        else:
-            data["upcoming_shows"].append({
-                "artist_id": artist.artist.id,
-                "artist_name": artist.artist.name,
-                "artist_image_link": artist.artist.image_link,
-                "start_time": artist.create_at.strftime("%d/%m/%Y %H:%M:%S")
+    for key, upcoming, page in (("upcoming_shows", True, upcoming_page), ("past_shows", False, past_page)):
+        for artist_id, artist_name, artist_image_link, start_time in \
+                page_of_shows(Show.Venue_id, venue_id, Artist, now, upcoming, page):
+            data[key].append({
+                "artist_id": artist_id,
+                "artist_name": artist_name,
+                "artist_image_link": artist_image_link,
+                "start_time": start_time.strftime("%d/%m/%Y %H:%M:%S")
             })
-    data['past_shows_count'] = len(data['past_shows'])
-    data['upcoming_shows_count'] = len(data['upcoming_shows'])
     return render_template('pages/show_venue.html', venue=data)
 
 
@@ -179,12 +382,14 @@ def create_venue_submission():
         address=request.form.get('address', ''),
         phone=request.form.get('phone', ''),
         image_link=request.form.get('image_link', ''),
-        genres=json.dumps(request.form.getlist('genres')),
+        genres=genres_named(request.form.getlist('genres')),
         facebook_link=request.form.get('facebook_link', ''),
     )
     try:
         db.session.add(venue)
         db.session.commit()
+        area_cache.invalidate()
+        venue_search_index.add(venue.id, venue.name, venue.city, venue.state, request.form.getlist('genres'))
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
     except:
         flash('An error occurred. Venue ' + venue.name + ' could not be listed.', 'error')
@@ -209,25 +414,24 @@ def artists():
     return render_template('pages/artists.html', artists=data)
 
 
-@app.route('/artists/search', methods=['POST'])
+@app.route('/artists/search', methods=['GET', 'POST'])
 def search_artists():
-    looking_for = '%{0}%'.format(request.form.get('search_term', ''))
-    result = db.session.query(Artist).filter(Artist.name.ilike(looking_for)).all()
-    data = []
-    for col in result:
-        data.append({"id": col.id, "name": col.name})
-    response = {"count": len(result), "data": data}
-    return render_template('pages/search_artists.html', results=response,
-                           search_term=request.form.get('search_term', ''))
+    response, search_term = search_page(Artist, artist_search_index)
+    return render_template('pages/search_artists.html', results=response, search_term=search_term)
 
 
 @app.route('/artists/<int:artist_id>')
 def show_artist(artist_id):
-    artist = db.session.query(Artist).get(artist_id)
+    artist = db.session.query(Artist).options(selectinload(Artist.genres)).get(artist_id)
+    if artist is None:
+        abort(404)
+    now = datetime.now()
+    upcoming_page, past_page = requested_show_pages()
+    upcoming_count, past_count = count_shows(Show.Artist_id, artist_id, now)
     data = {
         "id": artist.id,
         "name": artist.name,
-        "genres": json.loads(artist.genres),
+        "genres": [genre.name for genre in artist.genres],
         # "address": artist.address,
         "city": artist.city,
         "state": artist.state,
@@ -237,26 +441,21 @@ def show_artist(artist_id):
         "image_link": artist.image_link,
         "past_shows": [],
         "upcoming_shows": [],
-        "past_shows_count": 0,
-        "upcoming_shows_count": 0,
+        "past_shows_count": past_count,
+        "upcoming_shows_count": upcoming_count,
+        "past_page": past_page,
+        "upcoming_page": upcoming_page,
+        "shows_per_page": app.config['SHOWS_PER_PAGE'],
     }
-    for venue in artist.venues:
-        if venue.create_at < datetime.now():
-            data["past_shows"].append({
-                "artist_id": venue.venue.id,
-                "artist_name": venue.venue.name,
-                "artist_image_link": venue.venue.image_link,
-                "start_time": venue.create_at.strftime("%d/%m/%Y %H:%M:%S")
+    for key, upcoming, page in (("upcoming_shows", True, upcoming_page), ("past_shows", False, past_page)):
+        for venue_id, venue_name, venue_image_link, start_time in \
+                page_of_shows(Show.Artist_id, artist_id, Venue, now, upcoming, page):
+            data[key].append({
+                "venue_id": venue_id,
+                "venue_name": venue_name,
+                "venue_image_link": venue_image_link,
+                "start_time": start_time.strftime("%d/%m/%Y %H:%M:%S")
             })
-        else:
-            data["upcoming_shows"].append({
-                "artist_id": venue.venue.id,
-                "artist_name": venue.venue.name,
-                "artist_image_link": venue.venue.image_link,
-                "start_time": venue.create_at.strftime("%d/%m/%Y %H:%M:%S")
-            })
-    data['past_shows_count'] = len(data['past_shows'])
-    data['upcoming_shows_count'] = len(data['upcoming_shows'])
     return render_template('pages/show_artist.html', artist=data)
 
 
@@ -265,12 +464,12 @@ def show_artist(artist_id):
 @app.route('/artists/<int:artist_id>/edit', methods=['GET'])
 def edit_artist(artist_id):
     form = ArtistForm()
-    result = db.session.query(Artist).get(artist_id)
+    result = db.session.query(Artist).options(selectinload(Artist.genres)).get(artist_id)
 
     artist = {
         "id": result.id,
         "name": result.name,
-        "genres": json.loads(result.genres),
+        "genres": [genre.name for genre in result.genres],
         "city": result.city,
         "state": result.state,
         "phone": result.phone,
@@ -338,12 +537,13 @@ def create_artist_submission():
         state=request.form.get('state', ''),
         phone=request.form.get('phone', ''),
         image_link=request.form.get('image_link', ''),
-        genres=json.dumps(request.form.getlist('genres')),
+        genres=genres_named(request.form.getlist('genres')),
         facebook_link=request.form.get('facebook_link', '')
     )
     try:
         db.session.add(artist)
         db.session.commit()
+        artist_search_index.add(artist.id, artist.name, artist.city, artist.state, request.form.getlist('genres'))
         flash('Venue ' + request.form['name'] + ' was successfully listed!')
     except:
         flash('An error occurred. Venue ' + artist.name + ' could not be listed.')
@@ -360,15 +560,17 @@ def shows():
     # TODO:
     #       num_shows should be aggregated based on number of upcoming shows per venue.
     data = []
-    shows_list = db.session.query(Show).all()
-    for show in shows_list:
+    shows_list = db.session.query(Show.Venue_id, Venue.name, Show.Artist_id, Artist.name, Artist.image_link,
+                                  Show.create_at).join(Venue, Show.Venue_id == Venue.id) \
+        .join(Artist, Show.Artist_id == Artist.id).all()
+    for venue_id, venue_name, artist_id, artist_name, artist_image_link, create_at in shows_list:
         data.append({
-            "venue_id": show.venue.id,
-            "venue_name": show.venue.name,
-            "artist_id": show.artist.id,
-            "artist_name": show.artist.name,
-            "artist_image_link": show.artist.image_link,
-            "start_time": f"{show.create_at}"
+            "venue_id": venue_id,
+            "venue_name": venue_name,
+            "artist_id": artist_id,
+            "artist_name": artist_name,
+            "artist_image_link": artist_image_link,
+            "start_time": f"{create_at}"
         })
     return render_template('pages/shows.html', shows=data)
 
@@ -390,12 +592,31 @@ def create_show_submission():
     )
     db.session.add(show)
     db.session.commit()
+    area_cache.invalidate()
     # on successful db insert, flash success
     flash('Show was successfully listed!')
 
     return render_template('pages/home.html')
 
 
+#  Genres
+#  ----------------------------------------------------------------
+
+@app.route('/genres/<genre_name>/venues')
+def genre_venues(genre_name):
+    genre, venues, next_after_id = page_of_genre(Venue, venue_genres, genre_name,
+                                                 request.args.get('after_id', 0, type=int))
+    return render_template('pages/genre_venues.html', genre=genre.name, venues=venues, next_after_id=next_after_id)
+
+
+@app.route('/genres/<genre_name>/artists')
+def genre_artists(genre_name):
+    genre, artists, next_after_id = page_of_genre(Artist, artist_genres, genre_name,
+                                                  request.args.get('after_id', 0, type=int))
+    return render_template('pages/genre_artists.html', genre=genre.name, artists=artists,
+                           next_after_id=next_after_id)
+
+
 @app.errorhandler(404)
 def not_found_error(error):
     return render_template('errors/404.html'), 404
@@ -0,0 +1,49 @@
+import os
+import threading
+import time
+
+# seconds the venue directory is kept before it is loaded again, bounds how long another
+# worker process (which does not see this process invalidations) serves an old directory
+# and how long a show that started is still counted as upcoming
+AREA_CACHE_TTL = float(os.environ.get('AREA_CACHE_TTL', 60))
+
+'''
+AreaCache
+    keeps the rendered venue directory of GET /venues (the venues grouped by city
+    and state with their number of upcoming shows)
+    loaded on the first request after invalidate() (called when a venue or a show
+    is created) or after ttl seconds
+'''
+
+
+class AreaCache:
+    def __init__(self, ttl=AREA_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    '''
+    get(load)
+        returns the directory, load() is called to read it when it is not cached
+    '''
+
+    def get(self, load):
+        entry = self._entry
+        if entry is not None and time.monotonic() < entry[1]:
+            return entry[0]
+        version = self.version
+        areas = load()
+        with self._lock:
+            # a venue or a show was created while loading, keep the directory for this request only
+            if version == self.version:
+                self._entry = (areas, time.monotonic() + self.ttl)
+        return areas
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entry = None
+
+
+area_cache = AreaCache()
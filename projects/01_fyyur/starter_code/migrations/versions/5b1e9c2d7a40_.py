@@ -0,0 +1,26 @@
+"""index the shows of a venue and of an artist by start time
+
+Revision ID: 5b1e9c2d7a40
+Revises: 20ed63220911
+Create Date: 2026-10-18 10:12:41.318206
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5b1e9c2d7a40'
+down_revision = '20ed63220911'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_shows_venue_id_create_at', 'shows', ['Venue_id', 'create_at'], unique=False)
+    op.create_index('ix_shows_artist_id_create_at', 'shows', ['Artist_id', 'create_at'], unique=False)
+
+
+def downgrade():
+    op.drop_index('ix_shows_artist_id_create_at', table_name='shows')
+    op.drop_index('ix_shows_venue_id_create_at', table_name='shows')
@@ -0,0 +1,30 @@
+"""index the search documents of the venues and the artists
+
+Revision ID: 8d4a6f0c3e15
+Revises: 5b1e9c2d7a40
+Create Date: 2026-10-18 14:03:27.905114
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '8d4a6f0c3e15'
+down_revision = '5b1e9c2d7a40'
+branch_labels = None
+depends_on = None
+
+# search_document() of app.py, the search queries must use the very same expression
+SEARCH_DOCUMENT = "to_tsvector('simple', (((((coalesce(\"{0}\".name, '') || ' ') || coalesce(\"{0}\".city, '')) " \
+                  "|| ' ') || coalesce(\"{0}\".state, '')) || ' ') || coalesce(\"{0}\".genres, ''))"
+
+
+def upgrade():
+    for table in ('Venue', 'Artist'):
+        op.execute('CREATE INDEX "ix_{0}_search" ON "{0}" USING gin ({1})'.format(table, SEARCH_DOCUMENT.format(table)))
+
+
+def downgrade():
+    op.drop_index('ix_Artist_search', table_name='Artist')
+    op.drop_index('ix_Venue_search', table_name='Venue')
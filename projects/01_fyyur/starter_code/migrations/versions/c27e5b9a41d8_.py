@@ -0,0 +1,106 @@
+"""store the genres of the venues and the artists in a genres table
+
+Revision ID: c27e5b9a41d8
+Revises: 8d4a6f0c3e15
+Create Date: 2026-10-18 16:41:52.220571
+
+"""
+import json
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c27e5b9a41d8'
+down_revision = '8d4a6f0c3e15'
+branch_labels = None
+depends_on = None
+
+ENTITIES = (('Venue', 'venue_genres', 'venue_id'), ('Artist', 'artist_genres', 'artist_id'))
+
+# search_document() of app.py before (with the genres column) and after this revision
+OLD_SEARCH_DOCUMENT = "to_tsvector('simple', (((((coalesce(\"{0}\".name, '') || ' ') || coalesce(\"{0}\".city, '')) " \
+                      "|| ' ') || coalesce(\"{0}\".state, '')) || ' ') || coalesce(\"{0}\".genres, ''))"
+SEARCH_DOCUMENT = "to_tsvector('simple', (((coalesce(\"{0}\".name, '') || ' ') || coalesce(\"{0}\".city, '')) " \
+                  "|| ' ') || coalesce(\"{0}\".state, ''))"
+
+genres = sa.table('genres', sa.column('id', sa.Integer), sa.column('name', sa.String))
+
+
+def parse_genres(value):
+    # the json list of a genres column, the names fully kept by the ones cut at 120 characters
+    try:
+        names = json.loads(value or '[]')
+    except ValueError:
+        names = re.findall(r'"([^"]+)"', value)
+    if isinstance(names, str):
+        names = [names]
+    return [name.strip() for name in names if isinstance(name, str) and name.strip()]
+
+
+def replace_search_indexes(document):
+    for table, _, _ in ENTITIES:
+        op.drop_index('ix_{}_search'.format(table), table_name=table)
+        op.execute('CREATE INDEX "ix_{0}_search" ON "{0}" USING gin ({1})'.format(table, document.format(table)))
+
+
+def upgrade():
+    op.create_table('genres',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=120), nullable=False),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('name')
+    )
+    for table, association, column in ENTITIES:
+        op.create_table(association,
+        sa.Column(column, sa.Integer(), nullable=False),
+        sa.Column('genre_id', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint([column], ['{}.id'.format(table)], ondelete='CASCADE'),
+        sa.ForeignKeyConstraint(['genre_id'], ['genres.id'], ondelete='CASCADE'),
+        sa.PrimaryKeyConstraint(column, 'genre_id')
+        )
+        op.create_index('ix_{}_genre_id_{}'.format(association, column), association, ['genre_id', column],
+                        unique=False)
+
+    connection = op.get_bind()
+    entity_genres = {}
+    for table, _, _ in ENTITIES:
+        entity_genres[table] = [(entity_id, parse_genres(value)) for entity_id, value in
+                                connection.execute(sa.text('SELECT id, genres FROM "{}"'.format(table)))]
+    names = sorted(set(name for rows in entity_genres.values() for _, entity_names in rows for name in entity_names))
+    if names:
+        op.bulk_insert(genres, [{'name': name} for name in names])
+    genre_ids = dict((name, genre_id) for genre_id, name in connection.execute(sa.text('SELECT id, name FROM genres')))
+    for table, association, column in ENTITIES:
+        rows = [{column: entity_id, 'genre_id': genre_ids[name]}
+                for entity_id, entity_names in entity_genres[table] for name in set(entity_names)]
+        if rows:
+            op.bulk_insert(sa.table(association, sa.column(column, sa.Integer), sa.column('genre_id', sa.Integer)),
+                           rows)
+
+    replace_search_indexes(SEARCH_DOCUMENT)
+    for table, _, _ in ENTITIES:
+        op.drop_column(table, 'genres')
+
+
+def downgrade():
+    connection = op.get_bind()
+    for table, association, column in ENTITIES:
+        op.add_column(table, sa.Column('genres', sa.String(length=120), nullable=True))
+        entity_genres = {}
+        for entity_id, name in connection.execute(sa.text(
+                'SELECT a.{0}, g.name FROM {1} a JOIN genres g ON g.id = a.genre_id ORDER BY a.{0}, g.name'
+                .format(column, association))):
+            entity_genres.setdefault(entity_id, []).append(name)
+        for entity_id, names in entity_genres.items():
+            # the column only holds 120 characters, the last genres are dropped
+            while len(json.dumps(names)) > 120:
+                names.pop()
+            connection.execute(sa.text('UPDATE "{}" SET genres = :genres WHERE id = :id'.format(table)),
+                               genres=json.dumps(names), id=entity_id)
+        op.drop_index('ix_{}_genre_id_{}'.format(association, column), table_name=association)
+        op.drop_table(association)
+    op.drop_table('genres')
+    replace_search_indexes(OLD_SEARCH_DOCUMENT)
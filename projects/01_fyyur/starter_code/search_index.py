@@ -0,0 +1,169 @@
+import re
+import threading
+
+'''
+tokenize(text)
+    the lower case words (letters and digits) of the text
+'''
+
+
+def tokenize(text):
+    return re.findall(r'[^\W_]+', (text or '').lower())
+
+
+'''
+rank_key(words, name, entity_id)
+    the sort key of a search result, the same order the postgres search uses:
+    the names having more of the words (as word prefixes) first, then the names
+    starting with the first word, then the shortest names, then by id
+'''
+
+
+def rank_key(words, name, entity_id):
+    name_words = tokenize(name)
+    in_name = sum(1 for word in words if any(name_word.startswith(word) for name_word in name_words))
+    starts_with = bool(name_words) and name_words[0].startswith(words[0])
+    return -in_name, not starts_with, len(name or ''), entity_id
+
+
+'''
+PrefixTrie
+    words -> ids of the documents having them, ids(word) returns the ids of the word
+    and prefix_ids(prefix) the ids of every word starting with the prefix (the ids of
+    the sub tree of the prefix)
+'''
+
+
+class PrefixTrie:
+    def __init__(self):
+        self._root = {}
+
+    def add(self, word, entity_id):
+        node = self._root
+        for character in word:
+            node = node.setdefault(character, {})
+        node.setdefault(None, set()).add(entity_id)
+
+    def remove(self, word, entity_id):
+        path = [self._root]
+        for character in word:
+            node = path[-1].get(character)
+            if node is None:
+                return
+            path.append(node)
+        path[-1].get(None, set()).discard(entity_id)
+        if not path[-1].get(None, True):
+            del path[-1][None]
+        # drop the nodes left without words
+        for character, parent, node in zip(reversed(word), reversed(path[:-1]), reversed(path[1:])):
+            if node:
+                break
+            del parent[character]
+
+    def _node(self, word):
+        node = self._root
+        for character in word:
+            node = node.get(character)
+            if node is None:
+                return {}
+        return node
+
+    def ids(self, word):
+        return set(self._node(word).get(None, ()))
+
+    def prefix_ids(self, prefix):
+        node = self._node(prefix)
+        found = set()
+        nodes = [node]
+        while nodes:
+            node = nodes.pop()
+            for key, value in node.items():
+                if key is None:
+                    found |= value
+                else:
+                    nodes.append(value)
+        return found
+
+
+'''
+SearchIndex
+    in-memory search of the venues or the artists (name, city, state and genres)
+    used when the database is not postgres (which has a GIN index of the same words
+    and matches the genres through the association table)
+    built on the first search (build) then kept current by the create
+    endpoints (add), which do nothing until it is built
+'''
+
+
+class SearchIndex:
+    def __init__(self):
+        self.built = False
+        self._trie = PrefixTrie()
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    '''
+    build(rows)
+        rows is an iterable of (id, name, city, state, genre names)
+    '''
+
+    def build(self, rows):
+        with self._lock:
+            self._trie = PrefixTrie()
+            self._documents = {}
+            for row in rows:
+                self._add(*row)
+            self.built = True
+
+    def reset(self):
+        with self._lock:
+            self._trie = PrefixTrie()
+            self._documents = {}
+            self.built = False
+
+    def _add(self, entity_id, name, *fields):
+        words = set(tokenize(' '.join(field or '' for field in (name,) + fields)))
+        for word in words:
+            self._trie.add(word, entity_id)
+        self._documents[entity_id] = (name, words)
+
+    def _remove(self, entity_id):
+        document = self._documents.pop(entity_id, None)
+        if document is not None:
+            for word in document[1]:
+                self._trie.remove(word, entity_id)
+
+    def add(self, entity_id, name, city, state, genres=()):
+        with self._lock:
+            if self.built:
+                self._remove(entity_id)
+                self._add(entity_id, name, city, state, ' '.join(genres))
+
+    def remove(self, entity_id):
+        with self._lock:
+            if self.built:
+                self._remove(entity_id)
+
+    '''
+    search(term, offset, limit, max_results)
+        returns (total, results): the number of documents having every word of the
+        term (the last one as a word prefix) and limit of their (id, name) from offset
+        in rank_key order, only the max_results lowest ids of the matches are ranked
+    '''
+
+    def search(self, term, offset=0, limit=20, max_results=1000):
+        words = tokenize(term)
+        if not words:
+            return 0, []
+        with self._lock:
+            matches = [self._trie.ids(word) for word in words[:-1]] + [self._trie.prefix_ids(words[-1])]
+            # the rarest word first so the intersection starts small
+            matches.sort(key=len)
+            found = sorted(set.intersection(*matches))[:max_results]
+            results = [(entity_id, self._documents[entity_id][0]) for entity_id in found]
+        results.sort(key=lambda result: rank_key(words, result[1], result[0]))
+        return len(results), results[offset:offset + limit]
+
+
+venue_search_index = SearchIndex()
+artist_search_index = SearchIndex()
@@ -0,0 +1,23 @@
+'''
+bench_category_pages.py [--database URL] [--backend DIR] [--runs N] [--category C] [--pages P ...]
+    median time of GET /categories/C/questions?page=, by default the pages 1, 2
+    and 1000 of the category 3
+        python bench/bench_category_pages.py
+'''
+
+from common import client, parser, report
+
+
+def main():
+    arguments = parser('median time of GET /categories/<id>/questions pages')
+    arguments.add_argument('--category', type=int, default=3)
+    arguments.add_argument('--pages', type=int, nargs='+', default=[1, 2, 1000])
+    arguments = arguments.parse_args()
+    test_client = client(arguments)
+    for page in arguments.pages:
+        url = '/categories/{}/questions?page={}'.format(arguments.category, page)
+        report('page {}'.format(page), lambda: test_client.get(url), arguments.runs)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,25 @@
+'''
+bench_quiz.py [--database URL] [--backend DIR] [--runs N] [--previous N]
+    median time of POST /quizzes with --previous random previous questions,
+    for all the categories and for the category 1
+        python bench/bench_quiz.py
+'''
+
+import random
+
+from common import client, parser, report
+
+
+def main():
+    arguments = parser('median time of POST /quizzes')
+    arguments.add_argument('--previous', type=int, default=50)
+    arguments = arguments.parse_args()
+    test_client = client(arguments)
+    previous = random.sample(range(1, 100000), arguments.previous)
+    for name, category in (('all categories', 0), ('category 1', '1')):
+        body = {'previous_questions': previous, 'quiz_category': {'id': category}}
+        report(name, lambda: test_client.post('/quizzes', json=body), arguments.runs)
+
+
+if __name__ == '__main__':
+    main()
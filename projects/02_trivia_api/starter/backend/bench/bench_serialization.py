@@ -0,0 +1,49 @@
+'''
+bench_serialization.py [--database URL] [--backend DIR] [--runs N] [--sizes S ...]
+    median time and peak memory (tracemalloc) of reading and serializing one page of
+    questions, the first S by id, through the ORM (Question instances with their
+    category joined, then Question.format()) and through question_rows() and
+    format_question_row(), by default for pages of 10, 100 and 1000 questions
+        python bench/bench_serialization.py
+'''
+
+import tracemalloc
+
+from sqlalchemy.orm import joinedload
+
+from common import application, median_ms, parser
+
+
+def main():
+    arguments = parser('serialization time and memory of the ORM and the row read paths')
+    arguments.add_argument('--sizes', type=int, nargs='+', default=[10, 100, 1000])
+    arguments = arguments.parse_args()
+    app = application(arguments)
+    from models import db, format_question_row, question_rows, Question
+
+    def orm_page(size):
+        questions = Question.query.options(joinedload(Question.category_row)) \
+            .order_by(Question.id).limit(size).all()
+        page = [question.format() for question in questions]
+        # a new session per page, the instances are not found again in the identity map
+        db.session.remove()
+        return page
+
+    def rows_page(size):
+        page = [format_question_row(row) for row in question_rows().order_by(Question.id).limit(size)]
+        db.session.remove()
+        return page
+
+    with app.app_context():
+        for size in arguments.sizes:
+            for name, read_page in (('orm', orm_page), ('rows', rows_page)):
+                milliseconds = median_ms(lambda: read_page(size), arguments.runs)
+                tracemalloc.start()
+                read_page(size)
+                peak = tracemalloc.get_traced_memory()[1]
+                tracemalloc.stop()
+                print('{:>5} questions {:<5} {:8.2f} ms {:8.1f} KiB'.format(size, name, milliseconds, peak / 1024))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,50 @@
+import hashlib
+import json
+import os
+import threading
+import time
+
+# seconds the categories are kept before they are loaded again, bounds how long another
+# worker process (which does not see this process invalidations) serves old categories
+CATEGORY_CACHE_TTL = float(os.environ.get('CATEGORY_CACHE_TTL', 60))
+
+'''
+CategoryCache
+    keeps the {id: type} dict of the categories shared by every endpoint and its etag
+    loaded on the first request after invalidate() (called by Category.insert/update/delete)
+    or after ttl seconds
+'''
+
+
+class CategoryCache:
+    def __init__(self, ttl=CATEGORY_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._entry = None
+        self._lock = threading.Lock()
+
+    '''
+    get(load)
+        returns (categories, etag), load() is called to read the categories when they are not cached
+    '''
+
+    def get(self, load):
+        entry = self._entry
+        if entry is not None and time.monotonic() < entry[2]:
+            return entry[0], entry[1]
+        version = self.version
+        categories = load()
+        etag = hashlib.sha1(json.dumps(categories, sort_keys=True).encode()).hexdigest()
+        with self._lock:
+            # the categories changed while loading, keep them for this request only
+            if version == self.version:
+                self._entry = (categories, etag, time.monotonic() + self.ttl)
+        return categories, etag
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entry = None
+
+
+category_cache = CategoryCache()
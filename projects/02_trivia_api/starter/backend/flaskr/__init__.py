@@ -1,13 +1,20 @@
 import json
 import os
-from flask import Flask, request, abort, jsonify
+from flask import Flask, request, abort, jsonify, stream_with_context
 from flask_sqlalchemy import SQLAlchemy
 from flask_cors import CORS
 import random
+import click
 
-from models import setup_db, Question, Category
+from models import setup_db, cached_categories, format_question_row, Question, Category
+from .bulk import IMPORT_BATCH_SIZE, export_questions, import_questions
+from .pagination import count_questions, requested_page
+from .quiz import next_quiz_question, pick_question, start_quiz
+from .search import search_questions
 
 QUESTIONS_PER_PAGE = 10
+BULK_MIMETYPES = {'csv': 'text/csv', 'ndjson': 'application/x-ndjson'}
+BULK_FORMATS = {mimetype: file_format for file_format, mimetype in BULK_MIMETYPES.items()}
 
 
 def create_app(test_config=None):
@@ -38,9 +45,10 @@ def create_app(test_config=None):
 
     @app.route('/categories')
     def get_categories():
-        categories = Category.query.all()
-        categories_list = {category.id: category.type for category in categories}
-        return jsonify({'categories': categories_list})
+        categories, etag = cached_categories()
+        response = jsonify({'categories': categories})
+        response.set_etag(etag)
+        return response.make_conditional(request)
 
     '''
     @TODO: 
@@ -57,21 +65,18 @@ def create_app(test_config=None):
 
     @app.route('/questions')
     def get_questions():
-        page = request.args.get('page', 1, int)
-        questions = Question.query.paginate(page, 10, False)
-        list_questions = [question.format() for question in questions.items]
+        questions, page, next_after_id = requested_page(QUESTIONS_PER_PAGE)
+        list_questions = [format_question_row(question) for question in questions]
         if len(list_questions) == 0:
             abort(404)
-        categories = Category.query.all()
-        categories_list = {}
-        current_categories = [current_category.category for current_category in questions.items]
-        for category in categories:
-            categories_list[category.id] = category.type
+        categories_list, _ = cached_categories()
+        current_categories = [current_category.category for current_category in questions]
 
         return jsonify({
             'questions': list_questions,
-            'page': questions.page,
-            'total_questions': questions.total,
+            'page': page,
+            'next_after_id': next_after_id,
+            'total_questions': count_questions(),
             'categories': categories_list,
             'current_category': current_categories
         })
@@ -114,13 +119,22 @@ def create_app(test_config=None):
             return abort(400)
         search = data.get('searchTerm')
         if search:
-            questions = Question.query.filter(Question.question.ilike("%{}%".format(search))).all()
-            list_questions = [question.format() for question in questions]
+            try:
+                page = int(data.get('page', 1))
+                category = data.get('category')
+                category = None if category is None else int(category)
+            except (TypeError, ValueError):
+                return abort(400)
+            if page < 1:
+                return abort(400)
+            questions, total = search_questions(search, category, page, QUESTIONS_PER_PAGE)
+            list_questions = [format_question_row(question) for question in questions]
             current_categories = [current_category.category for current_category in questions]
             return jsonify({
                 "questions": list_questions,
                 "current_category": current_categories,
-                "total_questions": len(questions)
+                "page": page,
+                "total_questions": total
             })
         else:
             try:
@@ -128,7 +142,7 @@ def create_app(test_config=None):
                     question=data['question'],
                     answer=data['answer'],
                     difficulty=data['difficulty'],
-                    category=data['category']
+                    category=int(data['category'])
                 )
                 question.insert()
                 return jsonify({
@@ -138,6 +152,54 @@ def create_app(test_config=None):
             except:
                 abort(422)
 
+    '''
+    POST /questions/import takes a csv (text/csv, with a question,answer,category,difficulty
+    header line) or ndjson (application/x-ndjson) body, read from the request stream
+    GET /questions/export?format=csv streams every question (ndjson by default)
+    '''
+
+    @app.route('/questions/import', methods=['POST'])
+    def bulk_import_questions():
+        file_format = BULK_FORMATS.get(request.mimetype)
+        if file_format is None:
+            return abort(400)
+        lines = (line.decode('utf-8', 'replace') for line in request.stream)
+        report = import_questions(lines, file_format)
+        return jsonify(dict(report, success=True))
+
+    @app.route('/questions/export')
+    def bulk_export_questions():
+        file_format = request.args.get('format', 'ndjson')
+        if file_format not in BULK_MIMETYPES:
+            return abort(400)
+        return app.response_class(stream_with_context(export_questions(file_format)),
+                                  mimetype=BULK_MIMETYPES[file_format])
+
+    @app.cli.command('import-questions')
+    @click.argument('path', type=click.Path(exists=True, dir_okay=False))
+    @click.option('--format', 'file_format', type=click.Choice(list(BULK_MIMETYPES)), default=None,
+                  help='csv or ndjson, from the file extension by default')
+    @click.option('--batch-size', default=IMPORT_BATCH_SIZE, help='questions per COPY and commit')
+    def import_questions_command(path, file_format, batch_size):
+        """Imports the questions of a csv or ndjson file."""
+        file_format = file_format or ('csv' if path.endswith('.csv') else 'ndjson')
+        with open(path, newline='', encoding='utf-8') as lines:
+            report = import_questions(lines, file_format, batch_size)
+        print('{} questions imported, {} errors'.format(report['created'], report['error_count']))
+        for error in report['errors']:
+            print(json.dumps(error))
+
+    @app.cli.command('export-questions')
+    @click.argument('path', type=click.Path(dir_okay=False, writable=True))
+    @click.option('--format', 'file_format', type=click.Choice(list(BULK_MIMETYPES)), default=None,
+                  help='csv or ndjson, from the file extension by default')
+    def export_questions_command(path, file_format):
+        """Writes every question to a csv or ndjson file."""
+        file_format = file_format or ('csv' if path.endswith('.csv') else 'ndjson')
+        with open(path, 'w', newline='', encoding='utf-8') as output:
+            for chunk in export_questions(file_format):
+                output.write(chunk)
+
     '''
     @TODO: 
     Create a POST endpoint to get questions based on a search term. 
@@ -160,12 +222,14 @@ def create_app(test_config=None):
 
     @app.route('/categories/<int:category_id>/questions')
     def get_questions_by_category(category_id):
-        questions = Question.query.filter_by(category=category_id).paginate()
-        current_categories = [current_category.category for current_category in questions.items]
-        questions_list = [question.format() for question in questions.items]
+        questions, page, next_after_id = requested_page(QUESTIONS_PER_PAGE, category_id)
+        current_categories = [current_category.category for current_category in questions]
+        questions_list = [format_question_row(question) for question in questions]
         return jsonify({
             "questions": questions_list,
-            "total_questions": questions.total,
+            "page": page,
+            "next_after_id": next_after_id,
+            "total_questions": count_questions(category_id),
             "current_category": current_categories
         })
 
@@ -186,26 +250,45 @@ def create_app(test_config=None):
         res = request.json
         if res is None:
             return abort(400)
-        quiz_category = res['quiz_category']
-        questions = Question.query.filter_by(category=quiz_category['id']).all() if quiz_category['id']\
-            else Question.query.all()
-        random.shuffle(questions)
-        for question in questions:
-            for previous_question in res['previous_questions']:
-                if previous_question == question.id:
-                    break
-            else:
-                return jsonify({
-                    "question": {
-                        "id": question.id,
-                        "question": question.question,
-                        "answer": question.answer,
-                        "difficulty": question.difficulty,
-                        "category": question.category
-                    }
-                })
-        else:
+        try:
+            category_id = int(res['quiz_category']['id'])
+            previous_questions = [int(question_id) for question_id in res['previous_questions']]
+        except (KeyError, TypeError, ValueError):
+            return abort(400)
+        question = pick_question(category_id, previous_questions)
+        if question is None:
             return jsonify({"question": False})
+        return jsonify({
+            "question": question.format()
+        })
+
+    @app.route('/quizzes/sessions', methods=['POST'])
+    def create_quiz_session():
+        res = request.json
+        if res is None:
+            return abort(400)
+        try:
+            category_id = int(res['quiz_category']['id'])
+        except (KeyError, TypeError, ValueError):
+            return abort(400)
+        token, total = start_quiz(category_id)
+        return jsonify({
+            "success": True,
+            "session": token,
+            "total_questions": total
+        })
+
+    @app.route('/quizzes/sessions/<token>/next', methods=['POST'])
+    def next_quiz_session_question(token):
+        try:
+            question = next_quiz_question(token)
+        except KeyError:
+            return abort(404)
+        if question is None:
+            return jsonify({"question": False})
+        return jsonify({
+            "question": question.format()
+        })
 
     '''
     @TODO: 
@@ -0,0 +1,123 @@
+import csv
+import io
+import json
+
+from models import Question, cached_categories
+
+IMPORT_FIELDS = ('question', 'answer', 'category', 'difficulty')
+IMPORT_BATCH_SIZE = 5000
+# an import reports the first errors and the number of errors
+MAX_IMPORT_ERRORS = 100
+
+'''
+validate_question(row, categories)
+    the row of an import ready for Question.bulk_insert
+    raises ValueError when it is not a question of one of the categories
+'''
+
+
+def validate_question(row, categories):
+    if not isinstance(row, dict):
+        raise ValueError('a question must be an object')
+    if not row.get('question') or not row.get('answer'):
+        raise ValueError('question and answer are required')
+    try:
+        category = int(row.get('category'))
+        difficulty = int(row.get('difficulty'))
+    except (TypeError, ValueError):
+        raise ValueError('category and difficulty must be integers')
+    if category not in categories:
+        raise ValueError('category {} does not exist'.format(category))
+    return {
+        'question': str(row['question']),
+        'answer': str(row['answer']),
+        'category': category,
+        'difficulty': difficulty
+    }
+
+
+'''
+read_rows(lines, file_format)
+    yields (line number, row) for the questions of csv (with a header line) or ndjson text lines
+    a line that can not be read is yielded as its error message
+'''
+
+
+def read_rows(lines, file_format):
+    if file_format == 'csv':
+        reader = csv.DictReader(lines)
+        for row in reader:
+            yield reader.line_num, row
+        return
+    for number, line in enumerate(lines, 1):
+        line = line.strip()
+        if not line:
+            continue
+        try:
+            yield number, json.loads(line)
+        except ValueError:
+            yield number, 'invalid json'
+
+
+'''
+import_questions(lines, file_format, batch_size)
+    imports the questions of csv or ndjson text lines (any iterable, read as they are inserted)
+    the rows that are not valid are skipped and every batch is committed on its own
+    returns {'created': number, 'error_count': number, 'errors': [first MAX_IMPORT_ERRORS errors]}
+    an error is {'line': number, 'message': string} or {'batch': first line, 'rows': number, 'message': string}
+'''
+
+
+def import_questions(lines, file_format, batch_size=IMPORT_BATCH_SIZE):
+    report = {'created': 0, 'error_count': 0, 'errors': []}
+    # line of the first row of every batch
+    first_lines = []
+
+    def error(entry):
+        report['error_count'] += 1
+        if len(report['errors']) < MAX_IMPORT_ERRORS:
+            report['errors'].append(entry)
+
+    def valid_rows():
+        categories = set(cached_categories()[0])
+        count = 0
+        for number, row in read_rows(lines, file_format):
+            try:
+                if isinstance(row, str):
+                    raise ValueError(row)
+                question = validate_question(row, categories)
+            except ValueError as message:
+                error({'line': number, 'message': str(message)})
+                continue
+            if count % batch_size == 0:
+                first_lines.append(number)
+            count += 1
+            yield question
+
+    report['created'], failures = Question.bulk_insert(valid_rows(), batch_size)
+    for start, rows, message in failures:
+        error({'batch': first_lines[start // batch_size], 'rows': rows, 'message': message})
+    return report
+
+
+'''
+export_questions(file_format)
+    yields the questions as csv (with a header line) or ndjson text, one chunk per batch of rows
+'''
+
+
+def export_questions(file_format, batch_size=IMPORT_BATCH_SIZE):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    if file_format == 'csv':
+        writer.writerow(('id',) + IMPORT_FIELDS)
+    for number, row in enumerate(Question.export_rows(batch_size), 1):
+        if file_format == 'csv':
+            writer.writerow(row)
+        else:
+            buffer.write(json.dumps(dict(zip(('id',) + IMPORT_FIELDS, row))) + '\n')
+        if number % batch_size == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue()
@@ -0,0 +1,86 @@
+from flask import request, abort
+
+from models import Question, question_index_ready, question_rows
+from question_index import question_index
+
+'''
+page_after_id(page, per_page, category)
+    turns a page number into an after_id cursor: the id of the last question of the
+    previous page, found in question_index (with an offset query when it is not built)
+    None when the page is before the first page or past the end
+'''
+
+
+def page_after_id(page, per_page, category=None):
+    if page < 1:
+        return None
+    if page == 1:
+        return 0
+    position = (page - 1) * per_page - 1
+    if question_index_ready():
+        return question_index.id_at(position, category)
+    query = Question.query.with_entities(Question.id)
+    if category is not None:
+        query = query.filter(Question.category == int(category))
+    row = query.order_by(Question.id).offset(position).limit(1).first()
+    return row[0] if row else None
+
+
+'''
+questions_page(after_id, per_page, category)
+    the per_page question rows (see question_rows) following the question after_id
+    (keyset on id) and the after_id of the next page (None on the last page)
+'''
+
+
+def questions_page(after_id, per_page, category=None):
+    query = question_rows().filter(Question.id > after_id)
+    if category is not None:
+        query = query.filter(Question.category == int(category))
+    questions = query.order_by(Question.id).limit(per_page + 1).all()
+    next_after_id = questions[per_page - 1].id if len(questions) > per_page else None
+    return questions[:per_page], next_after_id
+
+
+'''
+count_questions(category)
+    the number of questions (of the category), maintained by question_index
+'''
+
+
+def count_questions(category=None):
+    if question_index_ready():
+        return question_index.count(category)
+    query = Question.query
+    if category is not None:
+        query = query.filter(Question.category == int(category))
+    return query.count()
+
+
+'''
+requested_page(per_page, category)
+    reads ?after_id= (or ?page=, 1 by default) from the request and returns
+    (question rows, page, next_after_id), page is None when the cursor was given
+    aborts with a 400 when the cursor or the page is not a number (or is negative,
+    page starts at 1) rather than answering the first page again, and with a 404
+    when the page is past the end
+'''
+
+
+def requested_page(per_page, category=None):
+    after_id = request.args.get('after_id', None, int)
+    if 'after_id' in request.args and (after_id is None or after_id < 0):
+        abort(400)
+    page = None
+    if after_id is None:
+        # page numbers are kept for the frontend, they are turned into an after_id cursor
+        page = request.args.get('page', None, int)
+        if 'page' in request.args and (page is None or page < 1):
+            abort(400)
+        if page is None:
+            page = 1
+        after_id = page_after_id(page, per_page, category)
+        if after_id is None:
+            abort(404)
+    questions, next_after_id = questions_page(after_id, per_page, category)
+    return questions, page, next_after_id
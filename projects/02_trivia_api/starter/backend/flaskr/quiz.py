@@ -0,0 +1,98 @@
+import random
+
+from sqlalchemy.orm import joinedload
+
+from models import Question, question_index_ready
+from question_index import question_index
+from quiz_sessions import quiz_sessions
+
+'''
+load_question(question_id)
+    the question with its category (read by Question.format()) joined in the same query,
+    None when it does not exist
+'''
+
+
+def load_question(question_id):
+    return Question.query.options(joinedload(Question.category_row)).get(question_id)
+
+
+'''
+pick_question(category_id, previous_questions)
+    returns a random question of the category (any category when category_id is falsy)
+    that is not one of previous_questions, or None when every question was played
+    the id is sampled from question_index and only that row is loaded
+'''
+
+
+def pick_question(category_id, previous_questions):
+    if not question_index_ready():
+        return pick_question_sql(category_id, previous_questions)
+    excluded = set(previous_questions)
+    while True:
+        question_id = question_index.sample(category_id or None, excluded)
+        if question_id is None:
+            return None
+        question = load_question(question_id)
+        if question is not None:
+            return question
+        # deleted by another process, drop it from the index
+        question_index.remove(question_id)
+        excluded.add(question_id)
+
+
+'''
+pick_question_sql(category_id, previous_questions)
+    same as pick_question without the index, the previous questions are excluded in SQL
+    and only one row is loaded: a count of the candidates then a random offset into them
+'''
+
+
+def pick_question_sql(category_id, previous_questions):
+    query = Question.query
+    if category_id:
+        query = query.filter(Question.category == int(category_id))
+    if previous_questions:
+        query = query.filter(~Question.id.in_(set(previous_questions)))
+    count = query.count()
+    if count == 0:
+        return None
+    return query.options(joinedload(Question.category_row)).order_by(Question.id) \
+        .offset(random.randrange(count)).limit(1).first()
+
+
+'''
+start_quiz(category_id)
+    creates a quiz session playing every question of the category (all the questions
+    when category_id is falsy) once in a random order, returns (token, number of questions)
+'''
+
+
+def start_quiz(category_id):
+    if question_index_ready():
+        # shared by the sessions of the category until it changes
+        ids = question_index.snapshot(category_id or None)
+    else:
+        query = Question.query.with_entities(Question.id)
+        if category_id:
+            query = query.filter(Question.category == int(category_id))
+        ids = [question_id for question_id, in query]
+    return quiz_sessions.create(ids), len(ids)
+
+
+'''
+next_quiz_question(token)
+    the next question of the quiz session, None when every question was played
+    raises KeyError when the session does not exist or expired
+'''
+
+
+def next_quiz_question(token):
+    while True:
+        question_id = quiz_sessions.next_id(token)
+        if question_id is None:
+            return None
+        question = load_question(question_id)
+        # a question deleted since the session started is skipped
+        if question is not None:
+            return question
@@ -0,0 +1,33 @@
+from sqlalchemy import func
+
+from models import Question, SEARCH_CONFIG, question_rows, question_search_document
+from search_index import search_index, tokenize
+
+'''
+search_questions(term, category, page, per_page)
+    returns (rows, total): the page of the question rows (see question_rows) having every word of the term
+    (as a word prefix, "invent" matches "invented") in the category (any category when None)
+    and the number of those questions, best ranked first then by id
+    postgres answers from the GIN index ranked by ts_rank_cd, other databases from search_index
+'''
+
+
+def search_questions(term, category=None, page=1, per_page=10):
+    offset = (page - 1) * per_page
+    if search_index.built:
+        total, ids = search_index.search(term, category, offset, per_page)
+        questions = {row.id: row for row in question_rows().filter(Question.id.in_(ids))} if ids else {}
+        return [questions[question_id] for question_id in ids if question_id in questions], total
+    words = tokenize(term)
+    if not words:
+        return [], 0
+    # every word is a quoted prefix lexeme, the term can not inject tsquery operators
+    query = func.to_tsquery(SEARCH_CONFIG, ' & '.join("'{}':*".format(word) for word in words))
+    document = question_search_document()
+    matches = question_rows().filter(document.op('@@')(query))
+    if category is not None:
+        matches = matches.filter(Question.category == int(category))
+    total = matches.count()
+    questions = matches.order_by(func.ts_rank_cd(document, query).desc(), Question.id) \
+        .offset(offset).limit(per_page).all()
+    return questions, total
@@ -0,0 +1,66 @@
+"""questions and categories tables of trivia.psql
+
+Revision ID: 4c1f0e2b9a31
+Revises: 
+Create Date: 2026-10-18 10:12:04.518233
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '4c1f0e2b9a31'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+# postgres counts the statements changing the ids or the categories of the questions in
+# question_changes, every process compares it to the version of its question index
+# (see question_changes_version in models.py)
+QUESTION_CHANGES_FUNCTION = '''
+CREATE OR REPLACE FUNCTION count_question_changes() RETURNS trigger AS $$
+BEGIN
+    UPDATE question_changes SET version = version + 1;
+    RETURN NULL;
+END
+$$ LANGUAGE plpgsql'''
+
+
+def upgrade():
+    # the tables already exist in a database restored from trivia.psql
+    # (or created by setup_db), only an empty database gets them here
+    tables = sa.inspect(op.get_bind()).get_table_names()
+    if 'categories' not in tables:
+        op.create_table('categories',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('type', sa.Text(), nullable=True),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if 'questions' not in tables:
+        op.create_table('questions',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('question', sa.Text(), nullable=True),
+        sa.Column('answer', sa.Text(), nullable=True),
+        sa.Column('difficulty', sa.Integer(), nullable=True),
+        sa.Column('category', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['category'], ['categories.id'], name='category', onupdate='CASCADE', ondelete='SET NULL'),
+        sa.PrimaryKeyConstraint('id')
+        )
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('CREATE TABLE IF NOT EXISTS question_changes (version bigint NOT NULL)')
+        op.execute('INSERT INTO question_changes (version) SELECT 0 WHERE NOT EXISTS (SELECT 1 FROM question_changes)')
+        op.execute(QUESTION_CHANGES_FUNCTION)
+        op.execute('DROP TRIGGER IF EXISTS questions_changed ON questions')
+        op.execute('CREATE TRIGGER questions_changed '
+                   'AFTER INSERT OR DELETE OR UPDATE OF id, category OR TRUNCATE ON questions '
+                   'FOR EACH STATEMENT EXECUTE FUNCTION count_question_changes()')
+
+
+def downgrade():
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute('DROP TRIGGER IF EXISTS questions_changed ON questions')
+        op.execute('DROP FUNCTION IF EXISTS count_question_changes()')
+        op.execute('DROP TABLE IF EXISTS question_changes')
+    op.drop_table('questions')
+    op.drop_table('categories')
@@ -0,0 +1,26 @@
+"""index the questions by (category, id)
+
+Revision ID: 9e7d3a5c2f60
+Revises: 4c1f0e2b9a31
+Create Date: 2026-10-18 10:31:47.090216
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '9e7d3a5c2f60'
+down_revision = '4c1f0e2b9a31'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # a category page (category = ? AND id > ? ORDER BY id LIMIT ?) reads only its rows
+    # IF NOT EXISTS: setup_db (create_all) already creates it in a new database
+    op.execute('CREATE INDEX IF NOT EXISTS ix_questions_category_id ON questions (category, id)')
+
+
+def downgrade():
+    op.drop_index('ix_questions_category_id', table_name='questions')
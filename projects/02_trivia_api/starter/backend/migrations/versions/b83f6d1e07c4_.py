@@ -0,0 +1,55 @@
+"""integer foreign key from questions.category to categories.id
+
+Revision ID: b83f6d1e07c4
+Revises: 9e7d3a5c2f60
+Create Date: 2026-10-18 11:05:22.731904
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b83f6d1e07c4'
+down_revision = '9e7d3a5c2f60'
+branch_labels = None
+depends_on = None
+
+# the GIN index of the question search, the expression of question_search_document() in models.py
+# ('simple' is its SEARCH_CONFIG)
+SEARCH_INDEX = "CREATE INDEX CONCURRENTLY IF NOT EXISTS ix_questions_question_search ON questions " \
+               "USING gin (to_tsvector('simple', question))"
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+    column = [column for column in inspector.get_columns('questions') if column['name'] == 'category'][0]
+    if isinstance(column['type'], sa.Integer):
+        op.execute('UPDATE questions SET category = NULL WHERE category NOT IN (SELECT id FROM categories)')
+    else:
+        # created by setup_db when the model had a String column: keep the ids of
+        # existing categories, anything else becomes NULL, then store integers
+        op.execute('UPDATE questions SET category = NULL '
+                   'WHERE category NOT IN (SELECT CAST(id AS VARCHAR) FROM categories)')
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.alter_column('category', type_=sa.Integer(), postgresql_using='category::integer')
+    if not any(key['referred_table'] == 'categories' for key in inspector.get_foreign_keys('questions')):
+        with op.batch_alter_table('questions') as batch_op:
+            batch_op.create_foreign_key('category', 'categories', ['category'], ['id'],
+                                        onupdate='CASCADE', ondelete='SET NULL')
+    if op.get_bind().dialect.name == 'postgresql':
+        # built without locking the questions against writes, which can not run in a transaction
+        with op.get_context().autocommit_block():
+            # an index left invalid by a failed concurrent build is dropped and built again
+            if op.get_bind().execute(sa.text(
+                    "SELECT 1 FROM pg_index WHERE indexrelid = to_regclass('ix_questions_question_search') "
+                    "AND NOT indisvalid")).first() is not None:
+                op.execute('DROP INDEX CONCURRENTLY ix_questions_question_search')
+            op.execute(SEARCH_INDEX)
+
+
+def downgrade():
+    # the categories set to NULL by upgrade() are lost and going back to the String
+    # column would leave the foreign key of the first revision without its type
+    raise RuntimeError('revision b83f6d1e07c4 (integer questions.category foreign key) cannot be downgraded, '
+                       'restore a backup taken before upgrading to it instead')
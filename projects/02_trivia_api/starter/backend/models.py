@@ -1,12 +1,26 @@
 import os
-from sqlalchemy import Column, String, Integer, create_engine
+from sqlalchemy import Column, String, Integer, ForeignKey, Index, create_engine, exc, func, literal_column, select
 from flask_sqlalchemy import SQLAlchemy
+from flask_migrate import Migrate
+from sqlalchemy import inspect
+from itertools import islice
+import csv
+import io
 import json
 
+from category_cache import category_cache
+from question_index import question_index
+from search_index import search_index
+
 database_name = "trivia"
 database_path = "postgres://{}:{}@{}/{}".format('melad', '511998', 'localhost:5432', database_name)
 
 db = SQLAlchemy()
+migrate = Migrate()
+
+# text search configuration of the questions GIN index, 'simple' keeps every word
+# (no stop words, no stemming) so a search for "what is" still matches
+SEARCH_CONFIG = 'simple'
 
 '''
 setup_db(app)
@@ -19,7 +33,108 @@ def setup_db(app, database_path=database_path):
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
     db.app = app
     db.init_app(app)
+    migrate.init_app(app, db)
     db.create_all()
+    build_question_index()
+    build_search_index()
+    category_cache.invalidate()
+
+
+'''
+question_changes_version(connection)
+    the database version of the questions: on postgres the question_changes counter,
+    which a statement trigger bumps on every change of the ids or the categories of the
+    questions (both are created by the migration 4c1f0e2b9a31), None when the database
+    is not upgraded yet; (number of questions, last id) on other databases (which only
+    shows inserts and deletes)
+'''
+
+
+def question_changes_version(connection):
+    if db.engine.dialect.name == 'postgresql':
+        if connection.execute("SELECT to_regclass('question_changes')").scalar() is None:
+            return None
+        return connection.execute('SELECT version FROM question_changes').scalar()
+    return tuple(connection.execute(select([func.count(Question.id), func.max(Question.id)])).first())
+
+
+'''
+build_question_index()
+    loads the ids of the questions of every category into question_index
+    postgres groups them with array_agg, other databases stream the (id, category) rows
+    read on a connection of its own, the session of the current request is left alone
+'''
+
+
+def build_question_index():
+    with db.engine.connect() as connection:
+        version = question_changes_version(connection)
+        if db.engine.dialect.name == 'postgresql':
+            groups = connection.execute(
+                select([Question.category, func.array_agg(Question.id)]).group_by(Question.category)).fetchall()
+        else:
+            groups = {}
+            for question_id, category in connection.execute(select([Question.id, Question.category])):
+                groups.setdefault(category, []).append(question_id)
+            groups = groups.items()
+    question_index.build(groups, version)
+
+
+'''
+question_index_ready()
+    True when question_index can answer instead of the database: it is built, and at most
+    every QUESTION_INDEX_TTL seconds its version is compared to the database one, it is
+    built again when another process changed the questions
+'''
+
+
+def question_index_ready():
+    if question_index.built and question_index.check_due():
+        with db.engine.connect() as connection:
+            version = question_changes_version(connection)
+        if version != question_index.version:
+            build_question_index()
+    return question_index.built
+
+
+'''
+question_index_written()
+    called after a write of this process was applied to question_index, keeps its version
+    current unless another process wrote in between (see QuestionIndex.advance)
+'''
+
+
+def question_index_written():
+    if question_index.built and db.engine.dialect.name == 'postgresql':
+        with db.engine.connect() as connection:
+            question_index.advance(question_changes_version(connection))
+
+
+'''
+build_search_index()
+    postgres searches the questions through a GIN index on question_search_document(),
+    created by the migration b83f6d1e07c4
+    other databases load the question texts into search_index
+'''
+
+
+def build_search_index():
+    if db.engine.dialect.name == 'postgresql':
+        search_index.reset()
+    else:
+        search_index.build(db.session.query(Question.id, Question.category, Question.question).yield_per(10000))
+        db.session.remove()
+
+
+'''
+question_search_document()
+    the to_tsvector expression of ix_questions_question_search, queries must use
+    the same expression to be answered from the index
+'''
+
+
+def question_search_document():
+    return func.to_tsvector(literal_column("'{}'".format(SEARCH_CONFIG)), Question.question)
 
 
 '''
@@ -30,12 +145,18 @@ Question
 
 class Question(db.Model):
     __tablename__ = 'questions'
+    __table_args__ = (
+        Index('ix_questions_category_id', 'category', 'id'),
+    )
 
     id = Column(Integer, primary_key=True)
     question = Column(String)
     answer = Column(String)
-    category = Column(String)
+    category = Column(Integer, ForeignKey('categories.id', name='category', onupdate='CASCADE', ondelete='SET NULL'))
     difficulty = Column(Integer)
+    # the category of format() (for its type), loaded on access: the endpoints serializing
+    # Question instances join it explicitly (joinedload), the counts and the pages never read it
+    category_row = db.relationship('Category')
 
     def __init__(self, question, answer, category, difficulty):
         self.question = question
@@ -46,13 +167,25 @@ class Question(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        question_index.add(self.id, self.category)
+        question_index_written()
+        search_index.add(self.id, self.category, self.question)
 
     def update(self):
+        history = inspect(self).attrs.category.history
         db.session.commit()
+        if history.deleted:
+            question_index.move(self.id, history.deleted[0], self.category)
+            question_index_written()
+        search_index.add(self.id, self.category, self.question)
 
     def delete(self):
+        question_id, category = self.id, self.category
         db.session.delete(self)
         db.session.commit()
+        question_index.remove(question_id, category)
+        question_index_written()
+        search_index.remove(question_id)
 
     def format(self):
         return {
@@ -60,9 +193,83 @@ class Question(db.Model):
             'question': self.question,
             'answer': self.answer,
             'category': self.category,
+            'category_type': self.category_row.type if self.category_row is not None else None,
             'difficulty': self.difficulty
         }
 
+    '''
+    bulk_insert(rows, batch_size)
+        inserts the rows ({'question', 'answer', 'category', 'difficulty'} dicts, any iterable)
+        batch_size at a time, every batch is sent with COPY on postgres (executemany otherwise)
+        and committed on its own: a batch the database rejects is rolled back and reported,
+        the next ones are still inserted
+        returns (created, failures), a failure is (index of the first row of the batch, rows, message)
+        question_index and search_index are built again once at the end
+    '''
+
+    @staticmethod
+    def bulk_insert(rows, batch_size=5000):
+        rows = iter(rows)
+        created = 0
+        failures = []
+        start = 0
+        while True:
+            batch = list(islice(rows, batch_size))
+            if not batch:
+                break
+            try:
+                if db.engine.dialect.name == 'postgresql':
+                    copy_questions(batch)
+                else:
+                    db.session.execute(Question.__table__.insert(), batch)
+                db.session.commit()
+                created += len(batch)
+            except (exc.DBAPIError, db.engine.dialect.dbapi.Error) as error:
+                db.session.rollback()
+                failures.append((start, len(batch), str(getattr(error, 'orig', error)).strip()))
+            start += len(batch)
+        if created:
+            build_question_index()
+            build_search_index()
+        return created, failures
+
+    '''
+    export_rows(batch_size)
+        yields (id, question, answer, category, difficulty) for every question ordered by id
+        the table is read batch_size rows at a time (keyset on id)
+    '''
+
+    @staticmethod
+    def export_rows(batch_size=5000):
+        last_id = 0
+        while True:
+            rows = db.session.query(Question.id, Question.question, Question.answer, Question.category,
+                                    Question.difficulty) \
+                .filter(Question.id > last_id).order_by(Question.id).limit(batch_size).all()
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            last_id = rows[-1][0]
+
+
+'''
+copy_questions(rows)
+    sends the rows to postgres with COPY ... FROM STDIN (csv) in the session transaction
+    most of the time goes to the search GIN index and the category foreign key checks
+'''
+
+
+def copy_questions(rows):
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    for row in rows:
+        writer.writerow((row['question'], row['answer'], row['category'], row['difficulty']))
+    buffer.seek(0)
+    cursor = db.session.connection().connection.cursor()
+    cursor.copy_expert('COPY questions (question, answer, category, difficulty) FROM STDIN WITH (FORMAT csv)',
+                       buffer)
+
 
 '''
 Category
@@ -79,8 +286,67 @@ class Category(db.Model):
     def __init__(self, type):
         self.type = type
 
+    def insert(self):
+        db.session.add(self)
+        db.session.commit()
+        category_cache.invalidate()
+
+    def update(self):
+        db.session.commit()
+        category_cache.invalidate()
+
+    def delete(self):
+        db.session.delete(self)
+        db.session.commit()
+        category_cache.invalidate()
+
     def format(self):
         return {
             'id': self.id,
             'type': self.type
         }
+
+
+'''
+cached_categories()
+    the {id: type} dict of every category and its etag, served from category_cache
+'''
+
+
+def cached_categories():
+    return category_cache.get(lambda: {category.id: category.type
+                                       for category in Category.query.order_by(Category.id).all()})
+
+
+QUESTION_FIELDS = ('id', 'question', 'answer', 'category', 'category_type', 'difficulty')
+QUESTION_COLUMNS = (Question.id, Question.question, Question.answer, Question.category,
+                    Category.type.label('category_type'), Question.difficulty)
+
+'''
+format_question_row(row)
+    the dict of Question.format() from a question_rows() row (a tuple of QUESTION_FIELDS)
+    the keys are written out, about 3 times faster than dict(zip(QUESTION_FIELDS, row))
+'''
+
+
+def format_question_row(row):
+    return {
+        'id': row[0],
+        'question': row[1],
+        'answer': row[2],
+        'category': row[3],
+        'category_type': row[4],
+        'difficulty': row[5]
+    }
+
+
+'''
+question_rows()
+    a query of plain (id, question, answer, category, category_type, difficulty) rows
+    with the category type joined, for the list endpoints: no Question instance
+    (identity map, attribute instrumentation) is built, format_question_row serializes a row
+'''
+
+
+def question_rows():
+    return db.session.query(*QUESTION_COLUMNS).outerjoin(Category, Question.category == Category.id)
@@ -0,0 +1,208 @@
+import os
+import random
+import threading
+import time
+from array import array
+from bisect import bisect_left
+from itertools import chain
+
+# seconds between two comparisons of the index version with the database one (see
+# models.question_index_ready), bounds how long the writes of another worker process are not seen
+QUESTION_INDEX_TTL = float(os.environ.get('QUESTION_INDEX_TTL', 10))
+
+'''
+QuestionIndex
+    in-memory index of the question ids by category
+    every category keeps its ids in a sorted array of 64 bit integers (8 bytes per question)
+    built from the questions table (build) then kept current by
+    Question.insert/update/delete (add, move, remove) of this process
+    version is the database version it was built from, compared to the database
+    every ttl seconds to see the writes of the other processes
+    snapshot() shares one read only copy of the ids of a category until they change
+    answers the quiz sampling and the question counts without a query
+'''
+
+
+def category_key(category):
+    return str(category)
+
+
+class QuestionIndex:
+    def __init__(self, ttl=QUESTION_INDEX_TTL):
+        self.ttl = ttl
+        self.built = False
+        self.version = None
+        self._checked = 0.0
+        self._all = array('q')
+        self._by_category = {}
+        self._snapshots = {}
+        self._lock = threading.Lock()
+
+    '''
+    build(groups, version)
+        groups is an iterable of (category, ids of its questions)
+        version is the database version read before the groups
+    '''
+
+    def build(self, groups, version=None):
+        by_category = {}
+        for category, ids in groups:
+            by_category[category_key(category)] = array('q', sorted(ids))
+        all_ids = array('q', sorted(chain.from_iterable(by_category.values())))
+        with self._lock:
+            self._all = all_ids
+            self._by_category = by_category
+            self._snapshots = {}
+            self.version = version
+            self._checked = time.monotonic()
+            self.built = True
+
+    '''
+    check_due()
+        True once every ttl seconds (for one caller only), when the version should
+        be compared to the database one
+    '''
+
+    def check_due(self):
+        now = time.monotonic()
+        with self._lock:
+            if now - self._checked < self.ttl:
+                return False
+            self._checked = now
+            return True
+
+    '''
+    advance(version)
+        called with the database version read after a write of this process (already
+        applied with add, move or remove): the index stays current when that write is
+        the only one since its version, otherwise the next check builds it again
+    '''
+
+    def advance(self, version):
+        with self._lock:
+            if self.version is not None and version == self.version + 1:
+                self.version = version
+
+    def _ids(self, category):
+        if category is None:
+            return self._all
+        return self._by_category.get(category_key(category), array('q'))
+
+    @staticmethod
+    def _insert(ids, question_id):
+        if not ids or ids[-1] < question_id:
+            ids.append(question_id)
+            return
+        position = bisect_left(ids, question_id)
+        if position == len(ids) or ids[position] != question_id:
+            ids.insert(position, question_id)
+
+    @staticmethod
+    def _remove(ids, question_id):
+        position = bisect_left(ids, question_id)
+        if position < len(ids) and ids[position] == question_id:
+            del ids[position]
+
+    def _changed(self, *categories):
+        self._snapshots.pop(None, None)
+        for category in categories:
+            self._snapshots.pop(category_key(category), None)
+
+    def add(self, question_id, category):
+        with self._lock:
+            self._changed(category)
+            self._insert(self._all, question_id)
+            key = category_key(category)
+            if key not in self._by_category:
+                self._by_category[key] = array('q')
+            self._insert(self._by_category[key], question_id)
+
+    def remove(self, question_id, category=None):
+        with self._lock:
+            self._remove(self._all, question_id)
+            if category is not None:
+                self._changed(category)
+                self._remove(self._by_category.get(category_key(category), array('q')), question_id)
+            else:
+                self._snapshots = {}
+                for ids in self._by_category.values():
+                    self._remove(ids, question_id)
+
+    def move(self, question_id, old_category, new_category):
+        with self._lock:
+            self._changed(old_category, new_category)
+            self._remove(self._by_category.get(category_key(old_category), array('q')), question_id)
+            key = category_key(new_category)
+            if key not in self._by_category:
+                self._by_category[key] = array('q')
+            self._insert(self._by_category[key], question_id)
+
+    '''
+    count(category)
+        number of questions of the category, all the questions when category is None
+    '''
+
+    def count(self, category=None):
+        with self._lock:
+            return len(self._ids(category))
+
+    '''
+    ids(category)
+        a copy of the sorted ids of the category (all the questions when category is None)
+    '''
+
+    def ids(self, category=None):
+        with self._lock:
+            return array('q', self._ids(category))
+
+    '''
+    snapshot(category)
+        the sorted ids of the category (all the questions when category is None) as an
+        array shared by every caller until the category changes, it must not be modified
+        (the quiz sessions keep a reference instead of a copy each)
+    '''
+
+    def snapshot(self, category=None):
+        key = None if category is None else category_key(category)
+        with self._lock:
+            ids = self._snapshots.get(key)
+            if ids is None:
+                ids = self._snapshots[key] = array('q', self._ids(category))
+            return ids
+
+    '''
+    id_at(position, category)
+        the id at position (0 based, in id order) in the category, None past the end
+    '''
+
+    def id_at(self, position, category=None):
+        with self._lock:
+            ids = self._ids(category)
+            if 0 <= position < len(ids):
+                return ids[position]
+        return None
+
+    '''
+    sample(category, excluded)
+        a random id of the category (any category when category is None) not in the set excluded
+        or None when there is none left
+        random picks are retried while they hit excluded ids, the candidates are only listed
+        when most of the ids are excluded (at most twice the size of excluded)
+    '''
+
+    def sample(self, category=None, excluded=frozenset()):
+        with self._lock:
+            ids = self._ids(category)
+            size = len(ids)
+            if size == 0:
+                return None
+            if len(excluded) * 2 < size:
+                while True:
+                    question_id = ids[random.randrange(size)]
+                    if question_id not in excluded:
+                        return question_id
+            candidates = [question_id for question_id in ids if question_id not in excluded]
+        return random.choice(candidates) if candidates else None
+
+
+question_index = QuestionIndex()
@@ -0,0 +1,220 @@
+import os
+import secrets
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+
+# seconds a quiz session is kept after its last question
+QUIZ_SESSION_TTL = float(os.environ.get('QUIZ_SESSION_TTL', 3600))
+# most sessions kept in memory, the least recently used one is dropped for a new one
+QUIZ_MAX_SESSIONS = int(os.environ.get('QUIZ_MAX_SESSIONS', 10000))
+# 'memory' keeps the sessions in this process, any other value is the path of a sqlite
+# file, which every worker process (and a restarted server) shares
+QUIZ_SESSION_STORE = os.environ.get('QUIZ_SESSION_STORE', 'memory')
+
+ID_SIZE = array('q').itemsize
+
+'''
+Permutation
+    a random order of range(size) kept as 4 round keys instead of a shuffled list:
+    a 4 round Feistel network over the smallest even number of bits covering size,
+    values past size are encrypted again (cycle walking, less than 4 times on average)
+    so it stays a permutation of range(size), permutation[i] is computed in O(1)
+'''
+
+
+class Permutation:
+    def __init__(self, size, keys=None):
+        self.size = size
+        self.keys = tuple(keys) if keys is not None else tuple(secrets.randbits(32) for _ in range(4))
+        self._half = max(1, ((size - 1).bit_length() + 1) // 2)
+        self._mask = (1 << self._half) - 1
+
+    def _round(self, value, key):
+        value = ((value ^ key) * 0x9E3779B97F4A7C15) & 0xFFFFFFFFFFFFFFFF
+        return (value >> 32) & self._mask
+
+    def _encrypt(self, value):
+        left, right = value >> self._half, value & self._mask
+        for key in self.keys:
+            left, right = right, left ^ self._round(right, key)
+        return left << self._half | right
+
+    def __getitem__(self, index):
+        value = self._encrypt(index)
+        while value >= self.size:
+            value = self._encrypt(value)
+        return value
+
+
+'''
+MemorySessionStore
+    keeps the quiz sessions in this process: a reference to the question ids (an array
+    of 64 bit integers shared by the sessions of the same category, see
+    QuestionIndex.snapshot), the keys of their random order and the position of the next one
+    sessions are kept in least recently used order, so the expired ones are evicted
+    from the front of the dict, as well as the least recently used one past max_sessions
+'''
+
+
+class MemorySessionStore:
+    def __init__(self, ttl=QUIZ_SESSION_TTL, max_sessions=QUIZ_MAX_SESSIONS):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self._sessions = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _evict(self, now):
+        while self._sessions:
+            token, session = next(iter(self._sessions.items()))
+            if session[0] > now:
+                return
+            del self._sessions[token]
+
+    '''
+    create(ids)
+        stores a session playing the ids once each in a random order, returns its token
+        an array of ids is kept as is (not copied), it must not be modified afterwards
+    '''
+
+    def create(self, ids):
+        token = secrets.token_urlsafe(16)
+        now = time.monotonic()
+        if not isinstance(ids, array):
+            ids = array('q', ids)
+        with self._lock:
+            self._evict(now)
+            while len(self._sessions) >= self.max_sessions:
+                self._sessions.popitem(last=False)
+            self._sessions[token] = [now + self.ttl, 0, ids, Permutation(len(ids))]
+        return token
+
+    '''
+    next_id(token)
+        the next question id of the session (None once every question was played)
+        raises KeyError when the session does not exist or expired
+    '''
+
+    def next_id(self, token):
+        now = time.monotonic()
+        with self._lock:
+            self._evict(now)
+            session = self._sessions[token]
+            if session[0] <= now:
+                del self._sessions[token]
+                raise KeyError(token)
+            self._sessions.move_to_end(token)
+            session[0] = now + self.ttl
+            position = session[1]
+            if position == len(session[2]):
+                return None
+            session[1] = position + 1
+            return session[2][session[3][position]]
+
+    def __len__(self):
+        with self._lock:
+            self._evict(time.monotonic())
+            return len(self._sessions)
+
+
+'''
+SQLiteSessionStore
+    keeps the quiz sessions in a sqlite file: a small row per session (keys of the order,
+    position, expiry) and the ids in chunks of CHUNK_SIZE (8 bytes per question), so a
+    question reads one chunk and updates the small row whatever the number of questions
+    the expired sessions are deleted when a new session is created
+'''
+
+
+class SQLiteSessionStore:
+    CHUNK_SIZE = 512
+
+    def __init__(self, path, ttl=QUIZ_SESSION_TTL):
+        self.ttl = ttl
+        self._connection = sqlite3.connect(path, timeout=5, isolation_level=None, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._connection.execute('PRAGMA journal_mode = WAL')
+            self._connection.execute('PRAGMA synchronous = NORMAL')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS quiz_sessions (token TEXT PRIMARY KEY, keys BLOB NOT NULL, '
+                'size INTEGER NOT NULL, position INTEGER NOT NULL, expires REAL NOT NULL)')
+            self._connection.execute('CREATE INDEX IF NOT EXISTS ix_quiz_sessions_expires ON quiz_sessions (expires)')
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS quiz_session_ids '
+                '(token TEXT NOT NULL, chunk INTEGER NOT NULL, ids BLOB NOT NULL, PRIMARY KEY (token, chunk))')
+
+    def _execute(self, statements):
+        cursor = self._connection.cursor()
+        cursor.execute('BEGIN IMMEDIATE')
+        try:
+            result = statements(cursor)
+            cursor.execute('COMMIT')
+        except BaseException:
+            cursor.execute('ROLLBACK')
+            raise
+        return result
+
+    def create(self, ids):
+        token = secrets.token_urlsafe(16)
+        now = time.time()
+        ids = array('q', ids)
+        keys = array('q', Permutation(len(ids)).keys)
+        chunks = ((token, start // self.CHUNK_SIZE, ids[start:start + self.CHUNK_SIZE].tobytes())
+                  for start in range(0, len(ids), self.CHUNK_SIZE))
+
+        def insert(cursor):
+            cursor.execute('DELETE FROM quiz_session_ids WHERE token IN '
+                           '(SELECT token FROM quiz_sessions WHERE expires <= ?)', (now,))
+            cursor.execute('DELETE FROM quiz_sessions WHERE expires <= ?', (now,))
+            cursor.execute('INSERT INTO quiz_sessions VALUES (?, ?, ?, 0, ?)',
+                           (token, keys.tobytes(), len(ids), now + self.ttl))
+            cursor.executemany('INSERT INTO quiz_session_ids VALUES (?, ?, ?)', chunks)
+
+        with self._lock:
+            self._execute(insert)
+        return token
+
+    def next_id(self, token):
+        now = time.time()
+
+        def advance(cursor):
+            row = cursor.execute('SELECT keys, size, position FROM quiz_sessions WHERE token = ? AND expires > ?',
+                                 (token, now)).fetchone()
+            if row is None:
+                raise KeyError(token)
+            keys, size, position = row
+            if position == size:
+                cursor.execute('UPDATE quiz_sessions SET expires = ? WHERE token = ?', (now + self.ttl, token))
+                return None
+            chunk, offset = divmod(Permutation(size, array('q', keys))[position], self.CHUNK_SIZE)
+            ids = cursor.execute('SELECT ids FROM quiz_session_ids WHERE token = ? AND chunk = ?',
+                                 (token, chunk)).fetchone()[0]
+            cursor.execute('UPDATE quiz_sessions SET position = ?, expires = ? WHERE token = ?',
+                           (position + 1, now + self.ttl, token))
+            return array('q', ids[offset * ID_SIZE:(offset + 1) * ID_SIZE])[0]
+
+        with self._lock:
+            return self._execute(advance)
+
+    def __len__(self):
+        with self._lock:
+            return self._connection.execute(
+                'SELECT count(*) FROM quiz_sessions WHERE expires > ?', (time.time(),)).fetchone()[0]
+
+
+'''
+make_session_store(store, ttl)
+    the store named by QUIZ_SESSION_STORE: 'memory' or the path of a sqlite file
+'''
+
+
+def make_session_store(store=QUIZ_SESSION_STORE, ttl=QUIZ_SESSION_TTL):
+    if store == 'memory':
+        return MemorySessionStore(ttl, QUIZ_MAX_SESSIONS)
+    return SQLiteSessionStore(store, ttl)
+
+
+quiz_sessions = make_session_store()
@@ -0,0 +1,131 @@
+import re
+import threading
+from bisect import bisect_left, insort
+
+from question_index import category_key
+
+'''
+tokenize(text)
+    the lower case words (letters and digits) of the text, the same words postgres
+    to_tsvector('simple', text) keeps
+'''
+
+
+def tokenize(text):
+    return re.findall(r'[^\W_]+', (text or '').lower())
+
+
+'''
+SearchIndex
+    in-memory inverted index of the question texts (word -> {question id: occurrences})
+    used for the search when the database is not postgres (which has a GIN index)
+    built once from the questions table (build) then kept current by
+    Question.insert/update/delete (add, remove), which do nothing until it is built
+'''
+
+
+class SearchIndex:
+    def __init__(self):
+        self.built = False
+        self._postings = {}
+        self._words = []
+        self._documents = {}
+        self._lock = threading.Lock()
+
+    '''
+    build(rows)
+        rows is an iterable of (question id, category, question text)
+    '''
+
+    def build(self, rows):
+        with self._lock:
+            self.built = False
+            self._postings = {}
+            self._documents = {}
+            for question_id, category, text in rows:
+                self._add(question_id, category, text)
+            self._words = sorted(self._postings)
+            self.built = True
+
+    '''
+    reset()
+        drops the index, the search goes back to the database
+    '''
+
+    def reset(self):
+        with self._lock:
+            self._postings = {}
+            self._words = []
+            self._documents = {}
+            self.built = False
+
+    def _add(self, question_id, category, text):
+        words = {}
+        for word in tokenize(text):
+            words[word] = words.get(word, 0) + 1
+        for word, occurrences in words.items():
+            if word not in self._postings:
+                self._postings[word] = {}
+                if self.built:
+                    insort(self._words, word)
+            self._postings[word][question_id] = occurrences
+        self._documents[question_id] = (category_key(category), tuple(words))
+
+    def _remove(self, question_id):
+        document = self._documents.pop(question_id, None)
+        if document is None:
+            return
+        for word in document[1]:
+            postings = self._postings[word]
+            del postings[question_id]
+            if not postings:
+                del self._postings[word]
+                del self._words[bisect_left(self._words, word)]
+
+    def add(self, question_id, category, text):
+        with self._lock:
+            if self.built:
+                self._remove(question_id)
+                self._add(question_id, category, text)
+
+    def remove(self, question_id):
+        with self._lock:
+            if self.built:
+                self._remove(question_id)
+
+    def _prefix_matches(self, prefix):
+        matches = {}
+        position = bisect_left(self._words, prefix)
+        while position < len(self._words) and self._words[position].startswith(prefix):
+            for question_id, occurrences in self._postings[self._words[position]].items():
+                matches[question_id] = matches.get(question_id, 0) + occurrences
+            position += 1
+        return matches
+
+    '''
+    search(term, category, offset, limit)
+        returns (total, ids): the number of questions having every word of the term
+        (as a word prefix) in the category (any category when None) and limit of their
+        ids from offset, the most occurrences of the words first then by id
+    '''
+
+    def search(self, term, category=None, offset=0, limit=10):
+        words = tokenize(term)
+        if not words:
+            return 0, []
+        with self._lock:
+            # the rarest word first so the intersection starts small
+            matches = sorted((self._prefix_matches(word) for word in set(words)), key=len)
+            scores = matches[0]
+            for other in matches[1:]:
+                scores = {question_id: score + other[question_id]
+                          for question_id, score in scores.items() if question_id in other}
+            if category is not None:
+                key = category_key(category)
+                scores = {question_id: score for question_id, score in scores.items()
+                          if self._documents[question_id][0] == key}
+        ranked = sorted(scores, key=lambda question_id: (-scores[question_id], question_id))
+        return len(ranked), ranked[offset:offset + limit]
+
+
+search_index = SearchIndex()
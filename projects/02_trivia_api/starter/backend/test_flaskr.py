@@ -1,15 +1,29 @@
 import os
 import unittest
 import json
+from flask_migrate import upgrade
 from flask_sqlalchemy import SQLAlchemy
+from sqlalchemy import create_engine, event
 
 from flaskr import create_app
-from models import setup_db, Question, Category
+from models import setup_db, db, format_question_row, question_changes_version, question_rows, Question, Category
+from question_index import QUESTION_INDEX_TTL, question_index
+from search_index import SearchIndex
+from quiz_sessions import MemorySessionStore, Permutation, SQLiteSessionStore
 
 
 class TriviaTestCase(unittest.TestCase):
     """This class represents the trivia test case"""
 
+    @classmethod
+    def setUpClass(cls):
+        """Upgrade the test database (restored from trivia.psql) to the last migration,
+        which adds what setup_db does not create (the question_changes trigger, the search index)"""
+        app = create_app()
+        setup_db(app, "postgres://{}:{}@{}/{}".format('melad', '511998', 'localhost:5432', 'trivia_test'))
+        with app.app_context():
+            upgrade(directory=os.path.join(os.path.dirname(os.path.abspath(__file__)), 'migrations'))
+
     def setUp(self):
         """Define test variables and initialize app."""
         self.app = create_app()
@@ -34,6 +48,26 @@ class TriviaTestCase(unittest.TestCase):
     Write at least one test for each test for successful operation and for expected errors.
     """
 
+    def test_get_categories(self):
+        """ check that the categories are returned with an etag and revalidated with a 304"""
+        res = self.client().get('/categories')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(len(res.json['categories']), Category.query.count())
+        etag = res.headers['ETag']
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+
+    def test_categories_cache_invalidation(self):
+        """ check that a new category is served as soon as it is inserted"""
+        etag = self.client().get('/categories').headers['ETag']
+        category = Category(type='Music')
+        category.insert()
+        res = self.client().get('/categories', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['categories'][str(category.id)], 'Music')
+        category.delete()
+        self.assertNotIn(str(category.id), self.client().get('/categories').json['categories'])
+
     def test_get_questions(self):
         """ check that all questions return as expect from the database"""
         res = self.client().get('/questions')
@@ -41,6 +75,101 @@ class TriviaTestCase(unittest.TestCase):
         self.assertEqual(res.status_code, 200)
         self.assertEqual(len(data['questions']), 10)
 
+    def test_get_questions_after_id(self):
+        """ check that the after_id cursor continues where the page number pagination stops"""
+        first = self.client().get('/questions').json
+        self.assertEqual(first['total_questions'], Question.query.count())
+        ids = [question['id'] for question in first['questions']]
+        self.assertEqual(ids, sorted(ids))
+        by_cursor = self.client().get('/questions?after_id={}'.format(first['next_after_id'])).json
+        by_page = self.client().get('/questions?page=2').json
+        self.assertEqual(by_cursor['questions'], by_page['questions'])
+        self.assertGreater(by_cursor['questions'][0]['id'], ids[-1])
+
+    def test_get_questions_bad_cursor(self):
+        """ check that a malformed cursor or page is a 400, not the first page again"""
+        for query in ('after_id=abc', 'after_id=', 'after_id=-1', 'after_id=1.5', 'page=abc', 'page=0', 'page=-2'):
+            res = self.client().get('/questions?' + query)
+            self.assertEqual(res.status_code, 400, query)
+            self.assertFalse(res.json['success'])
+        category = Category.query.first()
+        res = self.client().get('/categories/{}/questions?after_id=x'.format(category.id))
+        self.assertEqual(res.status_code, 400)
+
+    def test_get_questions_by_category_pages(self):
+        """ check that a category is paginated by 10 with its own count"""
+        category = Category.query.first()
+        ids = sorted(question.id for question in Question.query.filter_by(category=category.id))
+        added = []
+        for number in range(11 - len(ids)):
+            question = Question(question='question {}'.format(number), answer='answer', category=category.id, difficulty=1)
+            question.insert()
+            added.append(question.id)
+        ids += added
+        try:
+            first = self.client().get('/categories/{}/questions'.format(category.id)).json
+            self.assertEqual(first['total_questions'], len(ids))
+            self.assertEqual([question['id'] for question in first['questions']], ids[:10])
+            second = self.client().get('/categories/{}/questions?page=2'.format(category.id)).json
+            self.assertEqual([question['id'] for question in second['questions']], ids[10:20])
+            self.assertEqual(set(second['current_category']), {category.id})
+            res = self.client().get('/categories/{}/questions?page=9'.format(category.id))
+            self.assertEqual(res.status_code, 404)
+        finally:
+            for question_id in added:
+                Question.query.get(question_id).delete()
+
+    def test_question_category_foreign_key(self):
+        """ check that a category sent as a string is stored as the integer id and named in the payload"""
+        category = Category.query.first().format()
+        res = self.client().post('/questions', json={
+            "question": "q", "answer": "a", "difficulty": 1, "category": str(category['id'])})
+        question = Question.query.get(res.json['created'])
+        try:
+            self.assertEqual(question.category, category['id'])
+            self.assertEqual(question.format()['category_type'], category['type'])
+            data = self.client().get('/categories/{}/questions'.format(category['id'])).json
+            self.assertEqual({question['category_type'] for question in data['questions']}, {category['type']})
+        finally:
+            Question.query.get(question.id).delete()
+
+    def test_import_questions(self):
+        """ check that a csv or ndjson import inserts the valid rows and reports the others"""
+        count = Question.query.count()
+        body = 'question,answer,category,difficulty\nimported 1,a,1,1\nimported 2,b,999,1\n"imported, 3",c,2,x\n'
+        res = self.client().post('/questions/import', data=body, content_type='text/csv')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['created'], 1)
+        self.assertEqual([error['line'] for error in res.json['errors']], [3, 4])
+        body = '{"question": "imported 4", "answer": "d", "category": 3, "difficulty": 2}\nnot json\n'
+        res = self.client().post('/questions/import', data=body, content_type='application/x-ndjson')
+        self.assertEqual((res.json['created'], res.json['error_count']), (1, 1))
+        imported = Question.query.filter(Question.question.like('imported%')).all()
+        try:
+            self.assertEqual(sorted(question.question for question in imported), ['imported 1', 'imported 4'])
+            self.assertEqual(question_index.count(), count + 2)
+            res = self.client().post('/questions/import', data=body, content_type='application/json')
+            self.assertEqual(res.status_code, 400)
+        finally:
+            for question in imported:
+                Question.query.get(question.id).delete()
+
+    def test_export_questions(self):
+        """ check that the export streams every question"""
+        res = self.client().get('/questions/export')
+        self.assertEqual(res.mimetype, 'application/x-ndjson')
+        rows = [json.loads(line) for line in res.data.decode().splitlines()]
+        self.assertEqual([row['id'] for row in rows], [question.id for question in Question.query.order_by(Question.id)])
+        res = self.client().get('/questions/export?format=csv')
+        self.assertEqual(res.data.decode().splitlines()[0], 'id,question,answer,category,difficulty')
+        self.assertEqual(len(res.data.decode().splitlines()), len(rows) + 1)
+
+    def test_question_rows_format(self):
+        """ check that a question row is serialized like the Question instance"""
+        rows = question_rows().order_by(Question.id).all()
+        questions = Question.query.order_by(Question.id).all()
+        self.assertEqual([format_question_row(row) for row in rows], [question.format() for question in questions])
+
     def test_get_question_not_found(self):
         """Check if the resource was not found, it will return the appropriate status code and error message"""
         res = self.client().get('/questions?page=1000')
@@ -77,6 +206,49 @@ class TriviaTestCase(unittest.TestCase):
         question_db = Question.query.get(data['created'])
         self.assertTrue(question_db)
 
+    def test_question_index_write_through(self):
+        """ Ensure the in-memory question index follows the inserted, moved and deleted questions"""
+        self.assertEqual(question_index.count(), Question.query.count())
+        count = question_index.count('6')
+        question = Question(question='index?', answer='yes', category='6', difficulty=1)
+        question.insert()
+        self.assertEqual(question_index.count('6'), count + 1)
+        self.assertIn(question.id, question_index.ids('6'))
+        question.category = '5'
+        question.update()
+        self.assertEqual(question_index.count('6'), count)
+        self.assertIn(question.id, question_index.ids('5'))
+        question.delete()
+        self.assertNotIn(question.id, question_index.ids())
+        # the writes of this process keep the index at the database version
+        with db.engine.connect() as connection:
+            self.assertEqual(question_index.version, question_changes_version(connection))
+
+    def test_question_index_sees_other_processes(self):
+        """ Ensure the questions written by another process are counted after the next version check"""
+        total = self.client().get('/questions').json['total_questions']
+        engine = create_engine(self.database_path)
+        try:
+            with engine.begin() as connection:
+                question_id = connection.execute(
+                    "INSERT INTO questions (question, answer, category, difficulty) "
+                    "VALUES ('other process?', 'yes', 1, 1) RETURNING id").scalar()
+            question_index.ttl = 0
+            res = self.client().get('/questions')
+            self.assertEqual(res.json['total_questions'], total + 1)
+            self.assertIn(question_id, question_index.ids('1'))
+            with engine.begin() as connection:
+                connection.execute('UPDATE questions SET category = 2 WHERE id = %s', question_id)
+            self.client().get('/questions')
+            self.assertIn(question_id, question_index.ids('2'))
+            with engine.begin() as connection:
+                connection.execute('DELETE FROM questions WHERE id = %s', question_id)
+            self.assertEqual(self.client().get('/questions').json['total_questions'], total)
+            self.assertNotIn(question_id, question_index.ids())
+        finally:
+            question_index.ttl = QUESTION_INDEX_TTL
+            engine.dispose()
+
     def test_failed_create_new_question(self):
         """Ensure that returned the corresponding error if there is an error when creating the new question"""
         res = self.client().post('/questions')
@@ -92,6 +264,31 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(data['current_category'])
         self.assertTrue(data['total_questions'])
 
+    def test_search_category_and_pages(self):
+        """ check that the search matches word prefixes, filters by category and is paginated"""
+        data = self.client().post('/questions', json={"searchTerm": "invent"}).json
+        self.assertIn('Who invented Peanut Butter?', [question['question'] for question in data['questions']])
+        data = self.client().post('/questions', json={"searchTerm": "which", "category": 3}).json
+        self.assertTrue(data['questions'])
+        self.assertEqual(set(data['current_category']), {3})
+        data = self.client().post('/questions', json={"searchTerm": "wh", "page": 2}).json
+        self.assertGreater(data['total_questions'], 10)
+        self.assertEqual(len(data['questions']), data['total_questions'] - 10)
+        res = self.client().post('/questions', json={"searchTerm": "wh", "page": 0})
+        self.assertEqual(res.status_code, 400)
+
+    def test_search_index(self):
+        """ check the in-memory search used without postgres: prefixes, ranking and category"""
+        index = SearchIndex()
+        index.build([(1, 1, 'What is the heaviest organ?'), (2, 2, 'What is what?'), (3, 1, 'Who painted it?')])
+        self.assertEqual(index.search('what'), (2, [2, 1]))
+        self.assertEqual(index.search('what', category=1), (1, [1]))
+        self.assertEqual(index.search('wh is'), (2, [2, 1]))
+        index.add(4, 1, 'Whatever it is')
+        index.remove(2)
+        self.assertEqual(index.search('what is'), (2, [1, 4]))
+        self.assertEqual(index.search('?'), (0, []))
+
     def test_play_quiz(self):
         """ Ensure the questions return successfully and this questions is unique"""
         res1 = self.client().post('/quizzes',
@@ -105,6 +302,109 @@ class TriviaTestCase(unittest.TestCase):
         self.assertTrue(res2.json['question'])
         self.assertNotEqual(res1.json['question']['id'], res2.json['question']['id'])
 
+    def test_question_category_joined_on_demand(self):
+        """ Ensure only the endpoints serializing Question instances join their category"""
+        self.assertNotIn('JOIN', str(Question.query.filter(Question.category == 1)))
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            statements.append(statement)
+
+        event.listen(db.engine, 'before_cursor_execute', before_cursor_execute)
+        try:
+            question = self.client().post('/quizzes', json={"previous_questions": [], "quiz_category": {"id": 1}}) \
+                .json['question']
+            session = self.client().post('/quizzes/sessions', json={"quiz_category": {"id": 1}}).json['session']
+            next_question = self.client().post('/quizzes/sessions/{}/next'.format(session)).json['question']
+        finally:
+            event.remove(db.engine, 'before_cursor_execute', before_cursor_execute)
+        category_type = Category.query.get(1).type
+        self.assertEqual(question['category_type'], category_type)
+        self.assertEqual(next_question['category_type'], category_type)
+        # joined to the question, never read by a query of its own
+        self.assertTrue([statement for statement in statements if 'JOIN categories' in statement])
+        self.assertFalse([statement for statement in statements if 'FROM categories' in statement])
+
+    def test_play_quiz_every_question_played(self):
+        """ Ensure no question is returned once every question of the category was played"""
+        played = [question.id for question in Question.query.filter(Question.category == '1').all()]
+        res = self.client().post('/quizzes',
+                                 json={"previous_questions": played, "quiz_category": {"type": "Science", "id": "1"}})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['question'], False)
+
+    def test_play_quiz_skips_previous_questions(self):
+        """ Ensure the only question left in the category is the one returned"""
+        played = [question.id for question in Question.query.filter(Question.category == '1').all()]
+        left = played.pop()
+        res = self.client().post('/quizzes',
+                                 json={"previous_questions": played, "quiz_category": {"type": "Science", "id": 1}})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['question']['id'], left)
+
+    def test_quiz_session(self):
+        """ Ensure a quiz session plays every question of the category once"""
+        category = [question.id for question in Question.query.filter(Question.category == '1').all()]
+        res = self.client().post('/quizzes/sessions', json={"quiz_category": {"type": "Science", "id": 1}})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['total_questions'], len(category))
+        url = '/quizzes/sessions/{}/next'.format(res.json['session'])
+        played = [self.client().post(url).json['question']['id'] for _ in category]
+        self.assertEqual(sorted(played), sorted(category))
+        self.assertEqual(self.client().post(url).json['question'], False)
+
+    def test_404_quiz_session(self):
+        """ Ensure an unknown quiz session is not found"""
+        res = self.client().post('/quizzes/sessions/unknown/next')
+        self.assertEqual(res.status_code, 404)
+
+    def test_quiz_session_stores(self):
+        """ check that both session stores play the ids in order and evict expired sessions"""
+        for store in (MemorySessionStore(), SQLiteSessionStore(':memory:')):
+            token = store.create([3, 1, 2])
+            played = [store.next_id(token) for _ in range(4)]
+            self.assertEqual(sorted(played[:3]), [1, 2, 3])
+            self.assertIsNone(played[3])
+            token = store.create(range(1, 1500))
+            self.assertEqual(sorted(store.next_id(token) for _ in range(1, 1500)), list(range(1, 1500)))
+            store.ttl = 0
+            expired = store.create([1])
+            self.assertRaises(KeyError, store.next_id, expired)
+            self.assertIsNone(store.next_id(token))
+
+    def test_quiz_session_store_limit(self):
+        """ check that the memory store drops the least recently used session past max_sessions"""
+        store = MemorySessionStore(max_sessions=2)
+        first = store.create([1])
+        second = store.create([2])
+        self.assertEqual(store.next_id(first), 1)
+        third = store.create([3])
+        self.assertEqual(len(store), 2)
+        self.assertRaises(KeyError, store.next_id, second)
+        self.assertIsNone(store.next_id(first))
+        self.assertEqual(store.next_id(third), 3)
+
+    def test_question_index_snapshot(self):
+        """ check that the quiz sessions of a category share one copy of its ids until it changes"""
+        snapshot = question_index.snapshot('1')
+        self.assertIs(question_index.snapshot(1), snapshot)
+        self.assertEqual(list(snapshot), list(question_index.ids('1')))
+        question = Question(question='snapshot?', answer='yes', category='1', difficulty=1)
+        question.insert()
+        try:
+            self.assertNotIn(question.id, snapshot)
+            self.assertIn(question.id, question_index.snapshot('1'))
+            self.assertIn(question.id, question_index.snapshot())
+        finally:
+            question.delete()
+
+    def test_quiz_permutation(self):
+        """ check that a permutation orders every index once"""
+        for size in (1, 2, 3, 10, 1000, 4097):
+            permutation = Permutation(size)
+            self.assertEqual(sorted(permutation[index] for index in range(size)), list(range(size)))
+        self.assertNotEqual([Permutation(1000)[index] for index in range(1000)], list(range(1000)))
+
     def test_400_play_quiz(self):
         """ Ensure the questions return successfully and this questions is unique"""
         res = self.client().post('/quizzes')
@@ -0,0 +1,78 @@
+'''
+bench_auth.py [--requests N]
+    time spent by requires_auth per request, with the verified token cache
+    disabled (TOKEN_CACHE_SIZE=0, every request runs jwt.decode) and enabled
+    the tokens are signed by a local RSA key published in a temporary JWKS file,
+    so neither Auth0 nor the network is needed
+        python bench/bench_auth.py
+'''
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def make_key(kid):
+    # an RSA key pair, the private key (PEM) and the public JWK
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    public_key = jwk.construct(private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo), 'RS256').to_dict()
+    public_key = {name: value.decode() if isinstance(value, bytes) else value for name, value in public_key.items()}
+    public_key.update(kid=kid, use='sig')
+    return pem, public_key
+
+
+def main():
+    parser = argparse.ArgumentParser(description='requires_auth overhead with and without the token cache')
+    parser.add_argument('--requests', type=int, default=2000)
+    arguments = parser.parse_args()
+
+    pem, public_key = make_key('bench')
+    jwks_path = os.path.join(tempfile.mkdtemp(), 'jwks.json')
+    with open(jwks_path, 'w') as jwks_file:
+        json.dump({'keys': [public_key]}, jwks_file)
+    os.environ['JWKS_URL'] = 'file://' + jwks_path
+    sys.path.insert(0, BACKEND)
+    from flask import Flask
+    from src.auth import auth
+
+    token = jwt.encode({
+        'iss': 'https://{}/'.format(auth.AUTH0_DOMAIN),
+        'aud': auth.API_AUDIENCE,
+        'sub': 'bench',
+        'exp': int(time.time()) + 3600,
+        'permissions': ['get:drinks-detail']
+    }, pem, algorithm='RS256', headers={'kid': 'bench'})
+
+    app = Flask(__name__)
+
+    @auth.requires_auth('get:drinks-detail')
+    def view(payload):
+        return 'ok'
+
+    for size in (0, 1024):
+        auth.verified_tokens.maxsize = size
+        auth.verified_tokens.clear()
+        with app.test_request_context(headers={'Authorization': 'Bearer ' + token}):
+            view()
+            start = time.perf_counter()
+            for _ in range(arguments.requests):
+                view()
+            elapsed = time.perf_counter() - start
+        print('TOKEN_CACHE_SIZE={:<5} {:8.1f} us per request (hits {}, misses {})'.format(
+            size, elapsed / arguments.requests * 1e6, auth.verified_tokens.hits, auth.verified_tokens.misses))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,76 @@
+'''
+bench_decode.py [--calls N] [--keys K]
+    decode throughput of the shared fsnd_auth.Auth0: calls per second of
+    - a JWK dict rebuilt per call from the key set (what the apps did before fsnd_auth,
+      jose constructs the key again on every decode)
+    - Auth0.verify_decode_jwt, the keys parsed once by kid (JWKSCache)
+    - Auth0.verify, the verified token cache in front of verify_decode_jwt
+    the key set has K keys, the token is signed by the last one
+        python bench/bench_decode.py
+'''
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+from jose import jwt
+
+from bench_auth import make_key
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), *(['..'] * 5)))
+DOMAIN = 'bench.auth0.com'
+AUDIENCE = 'bench'
+
+
+def calls_per_second(function, calls):
+    function()
+    start = time.perf_counter()
+    for _ in range(calls):
+        function()
+    return calls / (time.perf_counter() - start)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='decode throughput of fsnd_auth with and without its caches')
+    parser.add_argument('--calls', type=int, default=2000)
+    parser.add_argument('--keys', type=int, default=3)
+    arguments = parser.parse_args()
+
+    keys = [make_key('bench-{}'.format(number)) for number in range(arguments.keys)]
+    json_web_keys = {'keys': [public_key for _, public_key in keys]}
+    jwks_path = os.path.join(tempfile.mkdtemp(), 'jwks.json')
+    with open(jwks_path, 'w') as jwks_file:
+        json.dump(json_web_keys, jwks_file)
+    sys.path.insert(0, ROOT)
+    from fsnd_auth import Auth0
+
+    pem, public_key = keys[-1]
+    token = jwt.encode({
+        'iss': 'https://{}/'.format(DOMAIN),
+        'aud': AUDIENCE,
+        'sub': 'bench',
+        'exp': int(time.time()) + 3600,
+        'permissions': ['get:drinks-detail']
+    }, pem, algorithm='RS256', headers={'kid': public_key['kid']})
+
+    def rebuilt_key():
+        kid = jwt.get_unverified_header(token)['kid']
+        for key in json_web_keys['keys']:
+            if key['kid'] == kid:
+                rsa_key = {'kty': key['kty'], 'kid': key['kid'], 'use': key['use'], 'n': key['n'], 'e': key['e']}
+                return jwt.decode(token, rsa_key, algorithms=['RS256'], audience=AUDIENCE,
+                                  issuer='https://{}/'.format(DOMAIN))
+
+    auth0 = Auth0(DOMAIN, AUDIENCE, jwks_url='file://' + jwks_path)
+    for name, function in (('rebuilt JWK dict', rebuilt_key),
+                           ('verify_decode_jwt', lambda: auth0.verify_decode_jwt(token)),
+                           ('verify (cached)', lambda: auth0.verify(token))):
+        rate = calls_per_second(function, arguments.calls)
+        print('{:<18} {:10.0f} calls/s {:8.1f} us per call'.format(name, rate, 1e6 / rate))
+
+
+if __name__ == '__main__':
+    main()
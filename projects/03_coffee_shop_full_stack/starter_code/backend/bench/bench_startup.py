@@ -0,0 +1,79 @@
+'''
+bench_startup.py [--runs N] [--drinks D]
+    median time from the import of src.api to the first GET /drinks answered, every
+    run in a new python process on a temporary database:
+    - new database: the tables are created (db_create_all_if_missing)
+    - existing database: D drinks already stored, the schema version is only checked
+    - drop and create: what every start did before the fast boot path (db_drop_and_create_all),
+      on a copy of the existing database
+        python bench/bench_startup.py
+'''
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+START = '''
+import time
+start = time.perf_counter()
+from src.api import app
+from src.database.models import db_drop_and_create_all
+if {drop_and_create}:
+    db_drop_and_create_all()
+response = app.test_client().get('/drinks')
+assert response.status_code == 200, response.status_code
+print(time.perf_counter() - start)
+'''
+
+SEED = '''
+from src.api import app
+from src.database.models import Drink
+Drink.bulk_insert([{{'title': 'drink {{}}'.format(number), 'recipe': [{{'color': 'white', 'parts': 1}}]}}
+                   for number in range({drinks})])
+'''
+
+
+def run(code, database):
+    environment = dict(os.environ, DATABASE_URL='sqlite:///' + database,
+                       JWKS_URL='file://' + os.path.join(os.path.dirname(database), 'jwks.json'))
+    output = subprocess.run([sys.executable, '-c', code], cwd=BACKEND, env=environment, check=True,
+                            stdout=subprocess.PIPE, stderr=subprocess.DEVNULL).stdout
+    return float(output.decode().strip() or 0) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description='time from import to the first request served')
+    parser.add_argument('--runs', type=int, default=10)
+    parser.add_argument('--drinks', type=int, default=1000)
+    arguments = parser.parse_args()
+    directory = tempfile.mkdtemp()
+    with open(os.path.join(directory, 'jwks.json'), 'w') as jwks_file:
+        json.dump({'keys': []}, jwks_file)
+
+    def new_database(run_number):
+        return run(START.format(drop_and_create=False), os.path.join(directory, 'new-{}.db'.format(run_number)))
+
+    existing = os.path.join(directory, 'existing.db')
+    run(SEED.format(drinks=arguments.drinks), existing)
+
+    def drop_and_create(run_number):
+        # a copy of the seeded database, every run drops the same drinks
+        database = shutil.copy(existing, os.path.join(directory, 'drop-{}.db'.format(run_number)))
+        return run(START.format(drop_and_create=True), database)
+
+    for name, start in (('new database', new_database),
+                        ('existing database', lambda _: run(START.format(drop_and_create=False), existing)),
+                        ('drop and create', drop_and_create)):
+        times = [start(run_number) for run_number in range(arguments.runs)]
+        print('{:<18} {:8.1f} ms'.format(name, statistics.median(times)))
+
+
+if __name__ == '__main__':
+    main()
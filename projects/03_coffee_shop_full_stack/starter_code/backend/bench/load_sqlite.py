@@ -0,0 +1,82 @@
+'''
+load_sqlite.py [--profiles default tuned] [--seconds S] [--readers R] [--writers W]
+    concurrent read/write throughput of every SQLite profile (SQLITE_PROFILES) on a
+    temporary database of 200 drinks: the readers list and serialize the whole menu,
+    the writers update recipes, errors counts the reads or writes that failed
+    (database is locked)
+        python bench/load_sqlite.py
+'''
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+
+BACKEND = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+DRINKS = 200
+
+
+def run(profile, seconds, readers, writers):
+    from flask import Flask
+    from src.database.models import db, setup_db, Drink
+
+    app = Flask(__name__)
+    setup_db(app, 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'load.db'), profile)
+    with app.app_context():
+        db.create_all()
+        Drink.bulk_insert([{'title': 'drink {}'.format(i), 'recipe': [{'name': 'milk', 'color': 'white', 'parts': 1}]}
+                           for i in range(DRINKS)])
+    counts = {'reads': 0, 'writes': 0, 'errors': 0}
+    stop = time.monotonic() + seconds
+
+    def read():
+        with app.app_context():
+            while time.monotonic() < stop:
+                try:
+                    [drink.short() for drink in Drink.query.all()]
+                    counts['reads'] += 1
+                except Exception:
+                    counts['errors'] += 1
+                db.session.remove()
+
+    def write(writer):
+        with app.app_context():
+            step = 0
+            while time.monotonic() < stop:
+                try:
+                    drink = Drink.query.get(1 + (step * writers + writer) % DRINKS)
+                    drink.recipe = [{'name': 'milk', 'color': 'white', 'parts': step}]
+                    drink.update()
+                    counts['writes'] += 1
+                except Exception:
+                    db.session.rollback()
+                    counts['errors'] += 1
+                db.session.remove()
+                step += 1
+
+    threads = [threading.Thread(target=read) for _ in range(readers)] + \
+              [threading.Thread(target=write, args=(writer,)) for writer in range(writers)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    print('{:<8} {:7.0f} reads/s {:7.0f} writes/s {:5} errors'.format(
+        profile, counts['reads'] / seconds, counts['writes'] / seconds, counts['errors']))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='concurrent read/write throughput of the SQLite profiles')
+    parser.add_argument('--profiles', nargs='+', default=['default', 'tuned'])
+    parser.add_argument('--seconds', type=float, default=3)
+    parser.add_argument('--readers', type=int, default=4)
+    parser.add_argument('--writers', type=int, default=2)
+    arguments = parser.parse_args()
+    sys.path.insert(0, BACKEND)
+    for profile in arguments.profiles:
+        run(profile, arguments.seconds, arguments.readers, arguments.writers)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,39 +1,139 @@
 import os
-from flask import Flask, request, jsonify, abort
+from flask import Flask, request, jsonify, abort, stream_with_context
 from sqlalchemy import exc
+from sqlalchemy.orm import load_only
 import json
 from flask_cors import CORS
 from werkzeug.exceptions import HTTPException
 
-from .database.models import db_drop_and_create_all, setup_db, Drink
-from .auth.auth import AuthError, requires_auth
+from .database.models import db_create_all_if_missing, db_drop_and_create_all, migrate_recipes, parse_recipe, setup_db, \
+    Drink
+from .database.cache import menu_cache
+from .auth.auth import AuthError, auth0, requires_auth
+
+# page size of /drinks-detail when a page is asked without a limit, and the largest allowed limit
+DRINKS_PAGE_SIZE = 50
+DRINKS_MAX_PAGE_SIZE = 100
+DRINK_FIELDS = ('id', 'title', 'recipe')
+# most drinks accepted by one POST /drinks/bulk, and the longest title (the size of Drink.title)
+DRINKS_BULK_MAX = 5000
+DRINK_TITLE_LENGTH = 80
 
 app = Flask(__name__)
 setup_db(app)
 CORS(app)
+auth0.init_app(app)
+
+'''
+the tables are only created when they are missing (see db_create_all_if_missing)
+to start the db from scratch run: flask reset-db
+!! NOTE THIS WILL DROP ALL RECORDS
+'''
+db_create_all_if_missing()
+
+
+@app.cli.command('reset-db')
+def reset_db_command():
+    """Drops all the tables and creates them again."""
+    db_drop_and_create_all()
+    print('the database was reset')
 
 
-db_drop_and_create_all()
+@app.cli.command('migrate-recipes')
+def migrate_recipes_command():
+    """Rewrites the stored recipes into the list of ingredients form."""
+    print('{} drinks updated'.format(migrate_recipes()))
 
 
 # ROUTES
 
+'''
+menu_response(name, serialize)
+    the menu only changes on writes so the serialized body is cached (see MenuCache)
+    and answered with an etag, a client sending it back in If-None-Match gets a 304
+'''
+
+
+def menu_response(name, serialize, private=False):
+    def build():
+        drinks = Drink.query.all()
+        return json.dumps({
+            "success": True,
+            "drinks": [serialize(drink) for drink in drinks]
+        }).encode()
+
+    body, etag = menu_cache.get(name, build)
+    response = app.response_class(body, mimetype='application/json')
+    response.set_etag(etag)
+    response.cache_control.no_cache = True
+    if private:
+        response.cache_control.private = True
+    return response.make_conditional(request)
+
+
 @app.route('/drinks')
 def get_drinks():
-    drinks = Drink.query.all()
-    return jsonify({
-        "success": True,
-        "drinks": [drink.short() for drink in drinks]
-    })
+    return menu_response('drinks', Drink.short)
+
+
+'''
+drinks_page(after, limit, fields)
+    one page of the drinks ordered by id, starting after the drink id `after` (keyset)
+    only the columns of `fields` are loaded, next_cursor is the `after` of the next page
+'''
+
+
+def drinks_page(after, limit, fields):
+    columns = [getattr(Drink, field) for field in fields if field != 'id']
+    query = Drink.query.order_by(Drink.id)
+    if columns:
+        query = query.options(load_only(*columns))
+    else:
+        query = query.options(load_only(Drink.id))
+    if after is not None:
+        query = query.filter(Drink.id > after)
+    drinks = query.limit(limit + 1).all()
+    next_cursor = drinks[limit - 1].id if len(drinks) > limit else None
+    page = []
+    for drink in drinks[:limit]:
+        item = {'id': drink.id}
+        if 'title' in fields:
+            item['title'] = drink.title
+        if 'recipe' in fields:
+            item['recipe'] = drink.ingredients()
+        page.append(item)
+    return page, next_cursor
+
+
+'''
+GET /drinks-detail
+    without arguments the whole menu is returned (cached)
+    ?limit=&after=&fields=id,title,recipe returns one page, see drinks_page
+'''
 
 
 @app.route('/drinks-detail')
 @requires_auth('get:drinks-detail')
 def get_drinks_detail(jwt):
-    drinks = Drink.query.all()
+    if not any(argument in request.args for argument in ('limit', 'after', 'fields')):
+        return menu_response('drinks-detail', Drink.long, private=True)
+    # a value that is not a number is a 400, not the default (which would restart from the first page)
+    limit = request.args.get('limit', None, type=int)
+    after = request.args.get('after', None, type=int)
+    fields = request.args.get('fields', ','.join(DRINK_FIELDS)).split(',')
+    if 'limit' in request.args and (limit is None or limit < 1):
+        abort(400)
+    if 'after' in request.args and (after is None or after < 0):
+        abort(400)
+    if any(field not in DRINK_FIELDS for field in fields):
+        abort(400)
+    if limit is None:
+        limit = DRINKS_PAGE_SIZE
+    drinks, next_cursor = drinks_page(after, min(limit, DRINKS_MAX_PAGE_SIZE), fields)
     return jsonify({
         "success": True,
-        "drinks": [drink.long() for drink in drinks]
+        "drinks": drinks,
+        "next_cursor": next_cursor
     })
 
 
@@ -44,10 +144,13 @@ def create_drinks(jwt):
     if data is None or 'title' not in data or 'recipe' not in data:
         abort(400)
     title = data['title']
-    recipe = json.dumps(data['recipe'])
+    recipe = data['recipe']
     if title is None or recipe is None:
         abort(400)
-    drink = Drink(title=title, recipe=recipe)
+    try:
+        drink = Drink(title=title, recipe=recipe)
+    except ValueError:
+        abort(422)
     try:
         drink.insert()
     except HTTPException:
@@ -59,6 +162,104 @@ def create_drinks(jwt):
     })
 
 
+'''
+read_bulk_drinks()
+    the drinks of a bulk import, either a json array (or {"drinks": [...]})
+    or one json object per line when the content type is application/x-ndjson
+    the ndjson body is read line by line from the request stream
+    more than DRINKS_BULK_MAX drinks is answered with a 413
+'''
+
+
+def read_bulk_drinks():
+    if request.mimetype == 'application/x-ndjson':
+        drinks = []
+        for line in request.stream:
+            line = line.strip()
+            if line:
+                if len(drinks) == DRINKS_BULK_MAX:
+                    abort(413)
+                drinks.append(json.loads(line))
+        return drinks
+    data = request.get_json()
+    if isinstance(data, dict):
+        data = data.get('drinks')
+    if not isinstance(data, list):
+        abort(400)
+    if len(data) > DRINKS_BULK_MAX:
+        abort(413)
+    return data
+
+
+'''
+validate_bulk_drinks(drinks)
+    returns the drinks ready for Drink.bulk_insert and the list of errors
+    (index of the drink and message), titles must be non empty strings of at most
+    DRINK_TITLE_LENGTH characters and unique within the import
+'''
+
+
+def validate_bulk_drinks(drinks):
+    valid = []
+    errors = []
+    titles = set()
+    for index, drink in enumerate(drinks):
+        if not isinstance(drink, dict) or not drink.get('title') or drink.get('recipe') is None:
+            errors.append({'index': index, 'message': 'title and recipe are required'})
+            continue
+        if not isinstance(drink['title'], str) or len(drink['title']) > DRINK_TITLE_LENGTH:
+            errors.append({'index': index,
+                           'message': 'title must be a string of at most {} characters'.format(DRINK_TITLE_LENGTH)})
+            continue
+        if drink['title'] in titles:
+            errors.append({'index': index, 'message': 'duplicated title'})
+            continue
+        try:
+            recipe = parse_recipe(drink['recipe'])
+        except ValueError as error:
+            errors.append({'index': index, 'message': str(error)})
+            continue
+        titles.add(drink['title'])
+        valid.append({'title': drink['title'], 'recipe': recipe})
+    return valid, errors
+
+
+@app.route('/drinks/bulk', methods=['POST'])
+@requires_auth('post:drinks')
+def bulk_create_drinks(jwt):
+    try:
+        drinks = read_bulk_drinks()
+    except ValueError:
+        abort(400)
+    valid, errors = validate_bulk_drinks(drinks)
+    if errors:
+        return jsonify({
+            "success": False,
+            "error": 422,
+            "message": "unprocessable",
+            "errors": errors
+        }), 422
+    try:
+        created = Drink.bulk_insert(valid)
+    except exc.IntegrityError:
+        abort(422)
+    return jsonify({
+        "success": True,
+        "created": created
+    })
+
+
+@app.route('/drinks/export')
+@requires_auth('get:drinks-detail')
+def export_drinks(jwt):
+    def generate():
+        for drink_id, title, recipe in Drink.export_rows():
+            # the stored recipe blob is already json, it is written as is
+            yield '{{"id": {}, "title": {}, "recipe": {}}}\n'.format(drink_id, json.dumps(title), recipe)
+
+    return app.response_class(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+
 @app.route('/drinks/<int:drink_id>', methods=['PATCH'])
 @requires_auth('patch:drinks')
 def update_drink(jwt, drink_id):
@@ -69,7 +270,10 @@ def update_drink(jwt, drink_id):
         abort(400)
     drink.title = request.json['title']
     if 'recipe' in request.json:
-        drink.recipe = json.dumps(request.json['recipe'])
+        try:
+            drink.recipe = request.json['recipe']
+        except ValueError:
+            abort(422)
     try:
         drink.insert()
     except HTTPException:
@@ -99,6 +303,15 @@ def delete_drink(jwt, drink_id):
 # Error Handling
 
 
+@app.errorhandler(400)
+def bad_request(error):
+    return jsonify({
+        "success": False,
+        "error": 400,
+        "message": "bad request"
+    }), 400
+
+
 @app.errorhandler(422)
 def unprocessable(error):
     return jsonify({
@@ -108,6 +321,15 @@ def unprocessable(error):
     }), 422
 
 
+@app.errorhandler(413)
+def too_large(error):
+    return jsonify({
+        "success": False,
+        "error": 413,
+        "message": "too many drinks"
+    }), 413
+
+
 @app.errorhandler(404)
 def not_found(error):
     return jsonify({
@@ -1,106 +1,35 @@
-import json
-from flask import request, _request_ctx_stack
-from functools import wraps
-from jose import jwt
-from urllib.request import urlopen
+import os
+import sys
+
+# the shared auth package (fsnd_auth) lives at the root of the repository
+sys.path.append(os.path.abspath(os.path.join(os.path.dirname(__file__), *(['..'] * 6))))
+
+from fsnd_auth import Auth0, AuthError, get_token_auth_header
 
 AUTH0_DOMAIN = 'melad.us.auth0.com'
 ALGORITHMS = ['RS256']
 API_AUDIENCE = 'coffee'
 
-
-# AuthError Exception
-
-
-class AuthError(Exception):
-    def __init__(self, error, status_code):
-        self.error = error
-        self.status_code = status_code
-
-
-# Auth Header
-
-
-def get_token_auth_header():
-    if 'Authorization' not in request.headers:
-        raise AuthError('not authorization', 401)
-    auth = request.headers['Authorization'].split()
-    if len(auth) != 2 or auth[0].lower() != 'bearer':
-        raise AuthError('the header is malformed', 401)
-    return auth[1]
-
-
-def check_permissions(permission, payload):
-    if 'permissions' not in payload:
-        raise AuthError('not authorized', 401)
-    if permission not in payload['permissions']:
-        raise AuthError('not authorized', 401)
-    return True
-
-
-def verify_decode_jwt(token):
-    url_auth = urlopen(f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
-    json_web_keys = json.loads(url_auth.read())
-    unverified_header = jwt.get_unverified_header(token)
-    rsa_key = {}
-    if 'kid' not in unverified_header:
-        raise AuthError({
-            'code': 'invalid_header',
-            'description': 'Authorization malformed.'
-        }, 401)
-
-    for key in json_web_keys['keys']:
-        if key['kid'] == unverified_header['kid']:
-            rsa_key = {
-                'kty': key['kty'],
-                'kid': key['kid'],
-                'use': key['use'],
-                'n': key['n'],
-                'e': key['e']
-            }
-    if rsa_key:
-        try:
-            payload = jwt.decode(
-                token,
-                rsa_key,
-                algorithms=ALGORITHMS,
-                audience=API_AUDIENCE,
-                issuer='https://' + AUTH0_DOMAIN + '/'
-            )
-
-            return payload
-
-        except jwt.ExpiredSignatureError:
-            raise AuthError({
-                'code': 'token_expired',
-                'description': 'Token expired.'
-            }, 401)
-
-        except jwt.JWTClaimsError:
-            raise AuthError({
-                'code': 'invalid_claims',
-                'description': 'Incorrect claims. Please, check the audience and issuer.'
-            }, 401)
-        except Exception:
-            raise AuthError({
-                'code': 'invalid_header',
-                'description': 'Unable to parse authentication token.'
-            }, 400)
-    raise AuthError({
-        'code': 'invalid_header',
-        'description': 'Unable to find the appropriate key.'
-    }, 400)
-
-
-def requires_auth(permission=''):
-    def requires_auth_decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
-            token = get_token_auth_header()
-            payload = verify_decode_jwt(token)
-            check_permissions(permission, payload)
-            return f(payload, *args, **kwargs)
-
-        return wrapper
-
-    return requires_auth_decorator
+# the signing keys url, can point to a local file (file:///path/jwks.json) or a stub server
+JWKS_URL = os.environ.get('JWKS_URL', f'https://{AUTH0_DOMAIN}/.well-known/jwks.json')
+# seconds the fetched keys are trusted before they are fetched again
+JWKS_CACHE_TTL = int(os.environ.get('JWKS_CACHE_TTL', 600))
+# number of verified tokens kept in memory, 0 disables the cache
+TOKEN_CACHE_SIZE = int(os.environ.get('TOKEN_CACHE_SIZE', 1024))
+
+
+auth0 = Auth0(
+    AUTH0_DOMAIN,
+    API_AUDIENCE,
+    algorithms=ALGORITHMS,
+    jwks_url=JWKS_URL,
+    jwks_ttl=JWKS_CACHE_TTL,
+    token_cache_size=TOKEN_CACHE_SIZE,
+    permission_error_status=401
+)
+
+jwks_cache = auth0.jwks
+verified_tokens = auth0.verified_tokens
+verify_decode_jwt = auth0.verify_decode_jwt
+check_permissions = auth0.check_permissions
+requires_auth = auth0.requires_auth
@@ -0,0 +1,55 @@
+import hashlib
+import os
+import threading
+import time
+
+# seconds a cached menu is served before it is rebuilt, bounds how long another
+# worker process (which does not see this process invalidations) serves an old menu
+MENU_CACHE_TTL = float(os.environ.get('MENU_CACHE_TTL', 10))
+
+'''
+MenuCache
+    keeps the serialized bodies of the menu endpoints with their etags
+    a body is built on the first request after the menu changed (invalidate())
+    or after ttl seconds, every other request reuses the same bytes
+'''
+
+
+class MenuCache:
+    def __init__(self, ttl=MENU_CACHE_TTL):
+        self.ttl = ttl
+        self.version = 0
+        self._entries = {}
+        self._lock = threading.Lock()
+
+    '''
+    get(name, build)
+        returns the (body, etag) cached under name
+        build() is called to serialize the body when there is none
+    '''
+
+    def get(self, name, build):
+        entry = self._entries.get(name)
+        if entry is not None and time.monotonic() < entry[2]:
+            return entry[0], entry[1]
+        version = self.version
+        body = build()
+        etag = hashlib.sha1(body).hexdigest()
+        with self._lock:
+            # the menu changed while building, keep the body for this request only
+            if version == self.version:
+                self._entries[name] = (body, etag, time.monotonic() + self.ttl)
+        return body, etag
+
+    '''
+    invalidate()
+        drops every cached body, called after each write to the drinks table
+    '''
+
+    def invalidate(self):
+        with self._lock:
+            self.version += 1
+            self._entries = {}
+
+
+menu_cache = MenuCache()
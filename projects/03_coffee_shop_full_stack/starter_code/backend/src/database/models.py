@@ -1,25 +1,94 @@
 import os
-from sqlalchemy import Column, String, Integer
+import sqlite3
+import time
+from sqlalchemy import Column, String, Integer, Text, event
+from sqlalchemy.orm import validates
+from sqlalchemy.engine.url import make_url
+from sqlalchemy.pool import QueuePool
 from flask_sqlalchemy import SQLAlchemy
 import json
 
+from .cache import menu_cache
+
 database_filename = "database.db"
 project_dir = os.path.dirname(os.path.abspath(__file__))
-database_path = "sqlite:///{}".format(os.path.join(project_dir, database_filename))
+# DATABASE_URL points the app at another database (the tests use their own)
+database_path = os.environ.get('DATABASE_URL', "sqlite:///{}".format(os.path.join(project_dir, database_filename)))
 
 db = SQLAlchemy()
 
+# pragmas run on every new sqlite connection, pick one with the SQLITE_PROFILE environment variable
+# tuned: readers do not block the writer (WAL), fewer fsyncs (synchronous=NORMAL is safe with WAL),
+# the file is read through mmap and a locked database is retried for 5s instead of failing at once
+SQLITE_PROFILES = {
+    'default': {},
+    'tuned': {
+        'journal_mode': 'WAL',
+        'synchronous': 'NORMAL',
+        'mmap_size': 268435456,
+        'busy_timeout': 5000,
+        'temp_store': 'MEMORY'
+    }
+}
+SQLITE_PROFILE = os.environ.get('SQLITE_PROFILE', 'tuned')
+
+# bump when the tables change, stored in the sqlite user_version pragma
+SCHEMA_VERSION = 1
+
 '''
 setup_db(app)
     binds a flask application and a SQLAlchemy service
 '''
 
 
-def setup_db(app):
+def setup_db(app, database_path=database_path, sqlite_profile=SQLITE_PROFILE):
     app.config["SQLALCHEMY_DATABASE_URI"] = database_path
     app.config["SQLALCHEMY_TRACK_MODIFICATIONS"] = False
+    pragmas = SQLITE_PROFILES[sqlite_profile] if isinstance(sqlite_profile, str) else sqlite_profile
+    # the profiles (pool, connect_args and pragmas) only apply to sqlite
+    if make_url(database_path).get_backend_name() != 'sqlite':
+        pragmas = None
+    if pragmas:
+        # keep the connections (and their pragmas) open instead of reconnecting on every checkout
+        app.config["SQLALCHEMY_ENGINE_OPTIONS"] = {
+            "poolclass": QueuePool,
+            "connect_args": {"check_same_thread": False}
+        }
     db.app = app
     db.init_app(app)
+    if pragmas:
+        event.listen(db.get_engine(app), 'connect', sqlite_pragmas_hook(pragmas))
+
+
+'''
+sqlite_pragmas_hook(pragmas)
+    returns a connect event listener running "PRAGMA name = value" for every pragma
+    a pragma failing on a locked database (switching to WAL while another worker
+    holds a write lock fails at once, without waiting busy_timeout) is retried
+    for PRAGMA_LOCKED_RETRY seconds
+'''
+
+PRAGMA_LOCKED_RETRY = 5
+
+
+def sqlite_pragmas_hook(pragmas):
+    statements = ['PRAGMA {} = {}'.format(name, value) for name, value in pragmas.items()]
+
+    def set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        for statement in statements:
+            deadline = time.monotonic() + PRAGMA_LOCKED_RETRY
+            while True:
+                try:
+                    cursor.execute(statement)
+                    break
+                except sqlite3.OperationalError as error:
+                    if 'locked' not in str(error) or time.monotonic() > deadline:
+                        raise
+                    time.sleep(0.05)
+        cursor.close()
+
+    return set_sqlite_pragmas
 
 
 '''
@@ -33,6 +102,88 @@ db_drop_and_create_all()
 def db_drop_and_create_all():
     db.drop_all()
     db.create_all()
+    set_schema_version(SCHEMA_VERSION)
+    menu_cache.invalidate()
+
+
+'''
+db_create_all_if_missing()
+    fast boot path, keeps the existing records
+    when the database is already at SCHEMA_VERSION nothing is done,
+    otherwise the missing tables are created and the version is stored
+    the check and the creation run in one exclusive transaction, so workers starting
+    at the same time wait for each other and only the first one creates the tables
+'''
+
+
+def db_create_all_if_missing():
+    with db.engine.connect() as connection:
+        # pysqlite begins (deferred) transactions itself and commits before DDL,
+        # turn that off so the transaction is the BEGIN EXCLUSIVE below
+        dbapi_connection = connection.connection.connection
+        isolation_level = dbapi_connection.isolation_level
+        dbapi_connection.isolation_level = None
+        try:
+            with connection.begin():
+                connection.execute(db.text('BEGIN EXCLUSIVE'))
+                if connection.execute(db.text('PRAGMA user_version')).scalar() >= SCHEMA_VERSION:
+                    return False
+                db.metadata.create_all(bind=connection)
+                connection.execute(db.text('PRAGMA user_version = {:d}'.format(SCHEMA_VERSION)))
+            return True
+        finally:
+            dbapi_connection.isolation_level = isolation_level
+
+
+def get_schema_version():
+    with db.engine.connect() as connection:
+        return connection.execute(db.text('PRAGMA user_version')).scalar()
+
+
+def set_schema_version(version):
+    with db.engine.connect() as connection:
+        connection.execute(db.text('PRAGMA user_version = {:d}'.format(version)))
+
+
+'''
+parse_recipe(recipe)
+    turns a recipe (json string, list of ingredients or a single ingredient)
+    into a list of ingredients [{'color': string, 'name':string, 'parts':number}]
+    raises ValueError when the recipe does not have that shape
+'''
+
+
+def parse_recipe(recipe):
+    if isinstance(recipe, (str, bytes)):
+        recipe = json.loads(recipe)
+    if isinstance(recipe, dict):
+        recipe = [recipe]
+    if not isinstance(recipe, list):
+        raise ValueError('the recipe must be a list of ingredients')
+    for ingredient in recipe:
+        if not isinstance(ingredient, dict) or 'color' not in ingredient or 'parts' not in ingredient:
+            raise ValueError('every ingredient must have a color and parts')
+    return recipe
+
+
+'''
+migrate_recipes()
+    rewrites the recipes stored before parse_recipe existed (a single ingredient
+    object instead of a list) so every stored blob is a list of ingredients
+    returns the number of updated drinks
+'''
+
+
+def migrate_recipes():
+    updated = 0
+    for drink in Drink.query.all():
+        recipe = json.dumps(parse_recipe(drink.recipe))
+        if recipe != drink.recipe:
+            drink.recipe = recipe
+            updated += 1
+    db.session.commit()
+    menu_cache.invalidate()
+    return updated
 
 
 '''
@@ -48,7 +199,33 @@ class Drink(db.Model):
     title = Column(String(80), unique=True)
     # the ingredients blob - this stores a lazy json blob
     # the required datatype is [{'color': string, 'name':string, 'parts':number}]
-    recipe = Column(String(180), nullable=False)
+    recipe = Column(Text, nullable=False)
+
+    '''
+    validate_recipe()
+        the recipe can be assigned as a list of ingredients (or a json string)
+        it is stored as a json blob and the parsed list is kept on the instance
+    '''
+
+    @validates('recipe')
+    def validate_recipe(self, key, recipe):
+        ingredients = parse_recipe(recipe)
+        recipe = json.dumps(ingredients)
+        self._parsed_recipe = (recipe, ingredients)
+        return recipe
+
+    '''
+    ingredients()
+        the recipe as a list of ingredients, the blob is parsed only once per instance
+        (again only if the stored blob changed)
+    '''
+
+    def ingredients(self):
+        parsed = getattr(self, '_parsed_recipe', None)
+        if parsed is None or parsed[0] != self.recipe:
+            parsed = (self.recipe, parse_recipe(self.recipe))
+            self._parsed_recipe = parsed
+        return parsed[1]
 
     '''
     short()
@@ -56,8 +233,7 @@ class Drink(db.Model):
     '''
 
     def short(self):
-        # print(json.loads(self.recipe))
-        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in json.loads(self.recipe)]
+        short_recipe = [{'color': r['color'], 'parts': r['parts']} for r in self.ingredients()]
         return {
             'id': self.id,
             'title': self.title,
@@ -73,7 +249,7 @@ class Drink(db.Model):
         return {
             'id': self.id,
             'title': self.title,
-            'recipe': json.loads(self.recipe)
+            'recipe': self.ingredients()
         }
 
     '''
@@ -89,6 +265,7 @@ class Drink(db.Model):
     def insert(self):
         db.session.add(self)
         db.session.commit()
+        menu_cache.invalidate()
 
     '''
     delete()
@@ -102,6 +279,7 @@ class Drink(db.Model):
     def delete(self):
         db.session.delete(self)
         db.session.commit()
+        menu_cache.invalidate()
 
     '''
     update()
@@ -115,6 +293,53 @@ class Drink(db.Model):
 
     def update(self):
         db.session.commit()
+        menu_cache.invalidate()
+
+    '''
+    bulk_insert(drinks, batch_size)
+        inserts many drinks in a single transaction, batch_size rows per executemany
+        drinks is a list of {'title': string, 'recipe': list or json string}
+        already checked with parse_recipe, nothing is inserted if one row fails
+        EXAMPLE
+            Drink.bulk_insert([{'title': 'Water', 'recipe': [{'color': 'blue', 'name': 'water', 'parts': 1}]}])
+    '''
+
+    @staticmethod
+    def bulk_insert(drinks, batch_size=500):
+        table = Drink.__table__
+        rows = [{
+            'title': drink['title'],
+            'recipe': drink['recipe'] if isinstance(drink['recipe'], str) else json.dumps(drink['recipe'])
+        } for drink in drinks]
+        try:
+            for start in range(0, len(rows), batch_size):
+                db.session.execute(table.insert(), rows[start:start + batch_size])
+            db.session.commit()
+        except Exception:
+            db.session.rollback()
+            raise
+        finally:
+            menu_cache.invalidate()
+        return len(rows)
+
+    '''
+    export_rows(batch_size)
+        yields (id, title, recipe blob) for every drink ordered by id
+        the table is read batch_size rows at a time (keyset on id)
+        so it is never loaded in memory at once
+    '''
+
+    @staticmethod
+    def export_rows(batch_size=500):
+        last_id = 0
+        while True:
+            rows = db.session.query(Drink.id, Drink.title, Drink.recipe) \
+                .filter(Drink.id > last_id).order_by(Drink.id).limit(batch_size).all()
+            if not rows:
+                return
+            for row in rows:
+                yield row
+            last_id = rows[-1][0]
     #
     # def __repr__(self):
     #     return json.dumps(self.short())
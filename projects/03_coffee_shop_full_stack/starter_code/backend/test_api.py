@@ -0,0 +1,300 @@
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import time
+import unittest
+
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import rsa
+from jose import jwk, jwt
+
+# the tests never touch src/database/database.db, they use TEST_DATABASE_URL (a temporary file by default)
+# and sign their tokens with a local key published in a temporary JWKS file
+TEST_DIR = tempfile.mkdtemp()
+os.environ['DATABASE_URL'] = os.environ.get('TEST_DATABASE_URL',
+                                            'sqlite:///{}'.format(os.path.join(TEST_DIR, 'test.db')))
+os.environ['JWKS_URL'] = 'file://' + os.path.join(TEST_DIR, 'jwks.json')
+
+
+def make_key(kid):
+    """Generates an RSA key pair, returns the private key (PEM) and the public JWK"""
+    private_key = rsa.generate_private_key(public_exponent=65537, key_size=2048)
+    pem = private_key.private_bytes(serialization.Encoding.PEM, serialization.PrivateFormat.PKCS8,
+                                    serialization.NoEncryption())
+    public_key = jwk.construct(private_key.public_key().public_bytes(
+        serialization.Encoding.PEM, serialization.PublicFormat.SubjectPublicKeyInfo), 'RS256').to_dict()
+    public_key = {name: value.decode() if isinstance(value, bytes) else value for name, value in public_key.items()}
+    public_key.update(kid=kid, use='sig')
+    return pem, public_key
+
+
+PEM, PUBLIC_KEY = make_key('test-key')
+with open(os.path.join(TEST_DIR, 'jwks.json'), 'w') as jwks_file:
+    json.dump({'keys': [PUBLIC_KEY]}, jwks_file)
+
+from src.api import app, DRINKS_BULK_MAX
+from src.auth.auth import AUTH0_DOMAIN, API_AUDIENCE
+from src.database.cache import menu_cache
+from src.database.models import db, db_drop_and_create_all, migrate_recipes, parse_recipe, setup_db, Drink, \
+    SCHEMA_VERSION
+
+RECIPE = [{'color': 'blue', 'name': 'water', 'parts': 1}]
+
+
+class CoffeeShopTestCase(unittest.TestCase):
+    """This class represents the coffee shop test case"""
+
+    def setUp(self):
+        """Start every test from empty tables"""
+        db_drop_and_create_all()
+        self.client = app.test_client
+
+    def headers(self, *permissions, content_type='application/json'):
+        claims = {
+            'iss': f'https://{AUTH0_DOMAIN}/',
+            'aud': API_AUDIENCE,
+            'sub': 'barista',
+            'exp': int(time.time()) + 3600,
+            'permissions': list(permissions)
+        }
+        token = jwt.encode(claims, PEM, algorithm='RS256', headers={'kid': 'test-key'})
+        return {'Authorization': 'Bearer ' + token, 'Content-Type': content_type}
+
+    def bulk(self, body, content_type='application/json'):
+        return self.client().post('/drinks/bulk', data=body,
+                                  headers=self.headers('post:drinks', content_type=content_type))
+
+    def export(self):
+        res = self.client().get('/drinks/export', headers=self.headers('get:drinks-detail'))
+        self.assertEqual(res.status_code, 200)
+        return [json.loads(line) for line in res.data.decode().splitlines()]
+
+    def drinks_detail(self, query):
+        return self.client().get('/drinks-detail?' + query, headers=self.headers('get:drinks-detail'))
+
+    def menu_etag(self):
+        res = self.client().get('/drinks')
+        self.assertEqual(res.status_code, 200)
+        self.assertIsNotNone(res.headers.get('ETag'))
+        return res.headers['ETag']
+
+    def test_drinks_etag(self):
+        self.assertEqual(self.bulk(json.dumps([{'title': 'Water', 'recipe': RECIPE}])).status_code, 200)
+        etag = self.menu_etag()
+        self.assertEqual(self.menu_etag(), etag)
+        res = self.client().get('/drinks', headers={'If-None-Match': etag})
+        self.assertEqual(res.status_code, 304)
+        self.assertEqual(res.data, b'')
+        res = self.client().get('/drinks', headers={'If-None-Match': '"another"'})
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['drinks'][0]['title'], 'Water')
+
+    def test_drinks_etag_changes_on_writes(self):
+        self.assertEqual(self.bulk(json.dumps([{'title': 'Water', 'recipe': RECIPE}])).status_code, 200)
+        writes = (
+            lambda: self.client().post('/drinks', data=json.dumps({'title': 'Tea', 'recipe': RECIPE}),
+                                       headers=self.headers('post:drinks')),
+            lambda: self.client().patch('/drinks/1', data=json.dumps({'title': 'Sparkling water'}),
+                                        headers=self.headers('patch:drinks')),
+            lambda: self.client().delete('/drinks/2', headers=self.headers('delete:drinks'))
+        )
+        for write in writes:
+            etag = self.menu_etag()
+            self.assertIn('drinks', menu_cache._entries)
+            version = menu_cache.version
+            self.assertEqual(write().status_code, 200)
+            # the write dropped the cached body, the next request builds it with a new etag
+            self.assertGreater(menu_cache.version, version)
+            self.assertEqual(menu_cache._entries, {})
+            res = self.client().get('/drinks', headers={'If-None-Match': etag})
+            self.assertEqual(res.status_code, 200)
+            self.assertNotEqual(res.headers['ETag'], etag)
+        self.assertEqual([drink['title'] for drink in self.client().get('/drinks').json['drinks']],
+                         ['Sparkling water'])
+
+    def test_parse_recipe(self):
+        self.assertEqual(parse_recipe(RECIPE), RECIPE)
+        self.assertEqual(parse_recipe(json.dumps(RECIPE)), RECIPE)
+        # a single ingredient (the form stored before parse_recipe) is a list of one
+        self.assertEqual(parse_recipe(RECIPE[0]), RECIPE)
+        self.assertEqual(parse_recipe(json.dumps(RECIPE[0])), RECIPE)
+        for recipe in ('not json', 5, [{'name': 'water'}], [{'color': 'blue'}], ['water'], '"water"'):
+            with self.assertRaises(ValueError, msg=recipe):
+                parse_recipe(recipe)
+
+    def test_create_drink_bad_recipe(self):
+        for recipe in ('not json', [{'name': 'water'}], ['water']):
+            res = self.client().post('/drinks', data=json.dumps({'title': 'Water', 'recipe': recipe}),
+                                     headers=self.headers('post:drinks'))
+            self.assertEqual(res.status_code, 422, recipe)
+        self.assertEqual(self.export(), [])
+
+    def test_update_drink_bad_recipe(self):
+        self.assertEqual(self.bulk(json.dumps([{'title': 'Water', 'recipe': RECIPE}])).status_code, 200)
+        res = self.client().patch('/drinks/1', data=json.dumps({'title': 'Water', 'recipe': [{'name': 'water'}]}),
+                                  headers=self.headers('patch:drinks'))
+        self.assertEqual(res.status_code, 422)
+        db.session.rollback()
+        self.assertEqual(self.export()[0]['recipe'], RECIPE)
+
+    def test_ingredients_cache(self):
+        drink = Drink(title='Water', recipe=RECIPE)
+        ingredients = drink.ingredients()
+        self.assertEqual(ingredients, RECIPE)
+        # parsed once per instance
+        self.assertIs(drink.ingredients(), ingredients)
+        recipe = [{'color': 'brown', 'name': 'tea', 'parts': 2}]
+        drink.recipe = recipe
+        self.assertEqual(drink.ingredients(), recipe)
+        self.assertEqual(drink.short()['recipe'], [{'color': 'brown', 'parts': 2}])
+        # a blob loaded from the database (not assigned through the validator) is parsed again
+        drink.insert()
+        db.session.execute(Drink.__table__.update().values(recipe=json.dumps(RECIPE)))
+        db.session.commit()
+        self.assertEqual(drink.ingredients(), RECIPE)
+
+    def test_migrate_recipes(self):
+        # legacy rows store a single ingredient object, written around the validator
+        db.session.execute(Drink.__table__.insert(), [
+            {'title': 'Water', 'recipe': json.dumps(RECIPE[0])},
+            {'title': 'Tea', 'recipe': json.dumps(RECIPE)}
+        ])
+        db.session.commit()
+        self.assertEqual(migrate_recipes(), 1)
+        stored = [row[0] for row in db.session.query(Drink.recipe).order_by(Drink.id)]
+        self.assertEqual([json.loads(recipe) for recipe in stored], [RECIPE, RECIPE])
+        self.assertEqual(migrate_recipes(), 0)
+        self.assertEqual([drink['recipe'] for drink in self.client().get('/drinks').json['drinks']],
+                         [[{'color': 'blue', 'parts': 1}]] * 2)
+
+    def test_drinks_detail_pages(self):
+        drinks = [{'title': 'Drink {}'.format(i), 'recipe': RECIPE} for i in range(5)]
+        self.assertEqual(self.bulk(json.dumps(drinks)).status_code, 200)
+        res = self.drinks_detail('limit=2&fields=id,title')
+        self.assertEqual([drink['title'] for drink in res.json['drinks']], ['Drink 0', 'Drink 1'])
+        res = self.drinks_detail('limit=2&fields=id,title&after={}'.format(res.json['next_cursor']))
+        self.assertEqual([drink['title'] for drink in res.json['drinks']], ['Drink 2', 'Drink 3'])
+        res = self.drinks_detail('limit=2&after={}'.format(res.json['next_cursor']))
+        self.assertEqual([drink['title'] for drink in res.json['drinks']], ['Drink 4'])
+        self.assertIsNone(res.json['next_cursor'])
+
+    def test_drinks_detail_bad_arguments(self):
+        for query in ('after=abc', 'after=-1', 'after=', 'limit=0', 'limit=abc', 'fields=id,price'):
+            res = self.drinks_detail(query)
+            self.assertEqual(res.status_code, 400, query)
+            self.assertEqual(res.json['message'], 'bad request')
+
+    def test_bulk_create_drinks(self):
+        res = self.bulk(json.dumps([{'title': 'Water', 'recipe': RECIPE}, {'title': 'Tea', 'recipe': RECIPE}]))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['created'], 2)
+        self.assertEqual([drink['title'] for drink in self.export()], ['Water', 'Tea'])
+
+    def test_bulk_create_drinks_ndjson(self):
+        body = '\n'.join(json.dumps({'title': 'Drink {}'.format(i), 'recipe': RECIPE}) for i in range(3))
+        res = self.bulk(body, content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['created'], 3)
+
+    def test_bulk_bad_rows(self):
+        drinks = [
+            {'title': 'Water', 'recipe': RECIPE},
+            {'title': ['Water'], 'recipe': RECIPE},
+            {'title': {'name': 'Water'}, 'recipe': RECIPE},
+            {'title': 5, 'recipe': RECIPE},
+            {'title': 'x' * 81, 'recipe': RECIPE},
+            {'title': '', 'recipe': RECIPE},
+            {'title': 'No recipe'},
+            {'title': 'Bad recipe', 'recipe': [{'name': 'water'}]},
+            'Water'
+        ]
+        res = self.bulk(json.dumps(drinks))
+        self.assertEqual(res.status_code, 422)
+        self.assertFalse(res.json['success'])
+        self.assertEqual([error['index'] for error in res.json['errors']], [1, 2, 3, 4, 5, 6, 7, 8])
+        # nothing is inserted when one row fails
+        self.assertEqual(self.export(), [])
+
+    def test_bulk_duplicated_titles(self):
+        res = self.bulk(json.dumps([{'title': 'Water', 'recipe': RECIPE}, {'title': 'Water', 'recipe': RECIPE}]))
+        self.assertEqual(res.status_code, 422)
+        self.assertEqual(res.json['errors'], [{'index': 1, 'message': 'duplicated title'}])
+
+    def test_bulk_title_already_stored(self):
+        self.assertEqual(self.bulk(json.dumps([{'title': 'Water', 'recipe': RECIPE}])).status_code, 200)
+        res = self.bulk(json.dumps([{'title': 'Water', 'recipe': RECIPE}]))
+        self.assertEqual(res.status_code, 422)
+
+    def test_bulk_over_the_limit(self):
+        drinks = [{'title': 'Drink {}'.format(i), 'recipe': RECIPE} for i in range(DRINKS_BULK_MAX + 1)]
+        res = self.bulk(json.dumps(drinks))
+        self.assertEqual(res.status_code, 413)
+        res = self.bulk('\n'.join(json.dumps(drink) for drink in drinks), content_type='application/x-ndjson')
+        self.assertEqual(res.status_code, 413)
+        self.assertEqual(self.export(), [])
+
+    def test_bulk_at_the_limit(self):
+        # more than one executemany batch
+        drinks = [{'title': 'Drink {}'.format(i), 'recipe': RECIPE} for i in range(DRINKS_BULK_MAX)]
+        res = self.bulk(json.dumps(drinks))
+        self.assertEqual(res.status_code, 200)
+        self.assertEqual(res.json['created'], DRINKS_BULK_MAX)
+
+    def test_bulk_requires_permission(self):
+        res = self.client().post('/drinks/bulk', data=json.dumps([{'title': 'Water', 'recipe': RECIPE}]),
+                                 headers=self.headers('get:drinks-detail'))
+        self.assertEqual(res.status_code, 401)
+
+    def test_export_drinks(self):
+        drinks = [{'title': 'Drink "{}"'.format(i), 'recipe': RECIPE} for i in range(1200)]
+        self.assertEqual(self.bulk(json.dumps(drinks)).status_code, 200)
+        exported = self.export()
+        self.assertEqual(len(exported), 1200)
+        self.assertEqual([drink['title'] for drink in exported], [drink['title'] for drink in drinks])
+        self.assertEqual(exported[0]['recipe'], RECIPE)
+        ids = [drink['id'] for drink in exported]
+        self.assertEqual(ids, sorted(ids))
+
+    def test_export_requires_permission(self):
+        res = self.client().get('/drinks/export', headers=self.headers('post:drinks'))
+        self.assertEqual(res.status_code, 401)
+
+    def test_sqlite_profile_only_on_sqlite(self):
+        """The sqlite pool, connect_args and pragmas are not given to other databases"""
+        from flask import Flask
+        other = Flask(__name__)
+        try:
+            setup_db(other, 'postgresql://coffee@localhost/coffee', 'tuned')
+            self.assertFalse(other.config.get('SQLALCHEMY_ENGINE_OPTIONS'))
+            setup_db(other, 'sqlite:///' + os.path.join(TEST_DIR, 'other.db'), 'tuned')
+            self.assertEqual(other.config['SQLALCHEMY_ENGINE_OPTIONS']['connect_args'], {'check_same_thread': False})
+        finally:
+            db.app = app
+
+    def test_concurrent_starts(self):
+        """Workers starting together on a new database create the tables exactly once"""
+        database = os.path.join(TEST_DIR, 'concurrent.db')
+        start = 'from flask import Flask\n' \
+                'from src.database.models import db_create_all_if_missing, setup_db\n' \
+                'app = Flask(__name__)\n' \
+                'setup_db(app)\n' \
+                'print(db_create_all_if_missing())\n'
+        environment = dict(os.environ, DATABASE_URL='sqlite:///' + database)
+        workers = [subprocess.Popen([sys.executable, '-c', start], cwd=os.path.dirname(os.path.abspath(__file__)),
+                                    env=environment, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+                   for _ in range(4)]
+        outputs = [worker.communicate(timeout=60) for worker in workers]
+        self.assertEqual([worker.returncode for worker in workers], [0] * 4, outputs)
+        self.assertEqual(sorted(output.decode().strip() for output, _ in outputs), ['False'] * 3 + ['True'])
+        connection = sqlite3.connect(database)
+        self.assertEqual(connection.execute('PRAGMA user_version').fetchone()[0], SCHEMA_VERSION)
+        self.assertEqual(connection.execute('SELECT count(*) FROM drink').fetchone()[0], 0)
+        connection.close()
+
+
+# Make the tests conveniently executable
+if __name__ == "__main__":
+    unittest.main()